@@ -0,0 +1,62 @@
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+
+from cashiers.models import Cashier
+from client_loyalty.models import ClientLoyalty
+from clients.models import Client
+from companies.models import Company
+from items.models import Item
+from users.auth.tokens import LoyalTSlidingToken
+
+User = get_user_model()
+
+
+class BenchData:
+    def __init__(self, initial_points):
+        suffix = uuid.uuid4().hex[:8]
+        self.company = Company.objects.create(
+            user=User.objects.create(), name=f"bench-{suffix}", username=f"bench-company-{suffix}",
+            bonus_points_ratio=Decimal("0.1"),
+        )
+        self.cashier = Cashier.objects.create(
+            user=User.objects.create(), company=self.company, username=f"bench-cashier-{suffix}"
+        )
+        self.client = Client.objects.create(id=int(time.time() * 1000), first_name="bench")
+        self.item = Item.objects.create(company=self.company, name="bench", price=100)
+        ClientLoyalty.objects.create(client=self.client, company=self.company, points=initial_points)
+        self.token = str(LoyalTSlidingToken.for_user(self.cashier.user))
+
+    @property
+    def headers(self):
+        return {"Authorization": "Bearer " + self.token}
+
+    def sale(self, points_used=0, **extra):
+        return {
+            "items": [{"item_id": str(self.item.id), "quantity": 1, "sell_price": "100"}],
+            "total_price": 100,
+            "total_price_with_sale": 100 - points_used,
+            "points_used": points_used,
+            "client_id": self.client.id,
+        } | extra
+
+    def balance(self):
+        return ClientLoyalty.objects.get(client=self.client, company=self.company).points
+
+    def delete(self):
+        self.client.delete()
+        self.company.user.delete()
+        self.cashier.user.delete()
+
+
+@contextmanager
+def bench_data(initial_points=0):
+    """Временные компания, кассир, клиент и товар; удаляются вместе со всеми продажами."""
+    data = BenchData(initial_points)
+    try:
+        yield data
+    finally:
+        data.delete()
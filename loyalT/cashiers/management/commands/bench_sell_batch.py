@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from ._bench import bench_data
+
+
+class Command(BaseCommand):
+    help = "Сравнение синхронизации офлайн-продаж по одной и пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        total = options['sales']
+        api = APIClient()
+
+        with bench_data() as bench:
+            started = time.perf_counter()
+            for n in range(total):
+                response = api.post('/api/cashier/sell/', bench.sale(), format='json', headers=bench.headers)
+                assert response.status_code == 200, response.content
+            single = time.perf_counter() - started
+            single_balance = bench.balance()
+
+        with bench_data() as bench:
+            started = time.perf_counter()
+            for offset in range(0, total, options['batch_size']):
+                sales = [bench.sale(idempotency_key=f"bench-{n}")
+                         for n in range(offset, min(offset + options['batch_size'], total))]
+                response = api.post('/api/cashier/sell/batch/', {"sales": sales}, format='json',
+                                    headers=bench.headers)
+                assert response.status_code == 200, response.content
+            batched = time.perf_counter() - started
+            batch_balance = bench.balance()
+
+        self.stdout.write(f"single: {total} sales in {single:.2f}s ({total / single:.1f} sales/s), "
+                          f"balance {single_balance}")
+        self.stdout.write(f"batch of {options['batch_size']}: {total} sales in {batched:.2f}s "
+                          f"({total / batched:.1f} sales/s), balance {batch_balance}")
+        self.stdout.write(f"speedup: {single / batched:.1f}x")
@@ -0,0 +1,56 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+
+from ._bench import bench_data
+
+
+class Command(BaseCommand):
+    help = "Параллельные продажи одному клиенту: пропускная способность и итоговый баланс"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--sales', type=int, default=50, help="Продаж на один поток")
+        parser.add_argument('--initial-points', type=int, default=100)
+        parser.add_argument('--points-used', type=int, default=30, help="Списание в каждой второй продаже")
+
+    def handle(self, *args, **options):
+        # Отказы "Insufficient points" ожидаемы и не должны засорять вывод
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        with bench_data(options['initial_points']) as bench:
+            def sell(n):
+                points_used = options['points_used'] if n % 2 else 0
+                response = APIClient().post('/api/cashier/sell/', bench.sale(points_used),
+                                            format='json', headers=bench.headers)
+                connection.close()
+                return points_used, response.status_code
+
+            total = options['workers'] * options['sales']
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(sell, range(total)))
+            elapsed = time.perf_counter() - started
+
+            expected = options['initial_points']
+            ratio = bench.company.bonus_points_ratio
+            for points_used, status_code in results:
+                if status_code == 200:
+                    expected += -points_used if points_used else int((100 - points_used) * ratio)
+            balance = bench.balance()
+
+        accepted = sum(status_code == 200 for _, status_code in results)
+        rejected = sum(status_code == 400 for _, status_code in results)
+
+        self.stdout.write(f"sales: {total}, accepted: {accepted}, insufficient points: {rejected}")
+        self.stdout.write(f"elapsed: {elapsed:.2f}s, throughput: {total / elapsed:.1f} sales/s")
+        self.stdout.write(f"final balance: {balance}, expected: {expected}")
+
+        if balance != expected or balance < 0:
+            self.stderr.write(self.style.ERROR("Баланс не сошёлся"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Баланс сошёлся"))
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from rest_framework.exceptions import ValidationError
+
+QUOTE_TOKEN_SALT = 'cashiers.quote'
+
+
+def earned_points(price_with_sale, bonus_points_ratio):
+    return int(price_with_sale * bonus_points_ratio)
+
+
+def make_quote(company_id, client_id, total_price, balance, company_settings):
+    """Считает скидку и баллы для продажи и подписывает результат короткоживущим токеном."""
+    points_used = min(total_price * company_settings['max_sale'], balance)
+    price_with_sale = total_price - points_used
+    points_earn = company_settings['bonus_points_ratio'] * total_price
+
+    response = {
+        "client_balance": balance,
+        "price_with_sale": price_with_sale,
+        "points_used": points_used,
+        "after_sale_balance": balance - points_used,
+        'points_earn': points_earn,
+    }
+
+    # В токене суммы в том виде, в каком их запишет продажа: баллы списываются целыми
+    token_points_used = int(points_used)
+    token_price_with_sale = total_price - token_points_used
+    response['quote_token'] = signing.dumps({
+        'company_id': str(company_id),
+        'client_id': client_id,
+        'total_price': str(total_price),
+        'total_price_with_sale': str(token_price_with_sale),
+        'points_used': token_points_used,
+        'points_earned': earned_points(token_price_with_sale, company_settings['bonus_points_ratio']),
+    }, salt=QUOTE_TOKEN_SALT)
+
+    return response
+
+
+def load_quote(token, company_id, client_id):
+    """Проверяет подпись, срок и владельца токена и возвращает поля продажи из него."""
+    try:
+        quote = signing.loads(token, salt=QUOTE_TOKEN_SALT, max_age=settings.QUOTE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise ValidationError({"quote_token": "Invalid or expired quote token"})
+
+    if quote['company_id'] != str(company_id) or quote['client_id'] != client_id:
+        raise ValidationError({"quote_token": "Quote token was issued for another sale"})
+
+    return {
+        'total_price': Decimal(quote['total_price']),
+        'total_price_with_sale': Decimal(quote['total_price_with_sale']),
+        'points_used': quote['points_used'],
+        'points_earned': quote['points_earned'],
+    }
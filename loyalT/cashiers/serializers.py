@@ -5,6 +5,7 @@ from rest_framework_simplejwt.serializers import TokenObtainSlidingSerializer
 
 from companies.models import Company
 from utils.validators import validate_password
+from users.auth.tokens import LoyalTSlidingToken
 from utils.mixins import InvalidateOldTokenSerializerMixin
 
 from .models import Cashier
@@ -22,7 +23,7 @@ class CashierSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         password = validated_data.pop('password')
         validated_data['user'] = User.objects.create()
-        validated_data['company'] = self.context["request"].user.company
+        validated_data['company_id'] = self.context["request"].user.company_id
 
         cashier = Cashier(**validated_data)
         cashier.set_password(password)
@@ -44,6 +45,7 @@ class CashierTokenObtainSlidingSerializer(
     TokenObtainSlidingSerializer
 ):
     username_field = Cashier.USERNAME_FIELD
+    token_class = LoyalTSlidingToken
 
 
 class CashierPreSaleSerializer(serializers.Serializer):
@@ -61,8 +63,17 @@ class CashierSaleSerializer(serializers.Serializer):
     items = serializers.ListField(child=CashierItemSerializer())
     total_price_with_sale = serializers.DecimalField(max_digits=8, decimal_places=2)
     total_price = serializers.DecimalField(max_digits=8, decimal_places=2)
-    points_used = serializers.IntegerField()
+    points_used = serializers.IntegerField(min_value=0)
     client_id = serializers.IntegerField(allow_null=True)
+    quote_token = serializers.CharField(required=False, allow_blank=True)
+
+
+class CashierBatchSaleSerializer(CashierSaleSerializer):
+    idempotency_key = serializers.CharField(max_length=255, required=False, allow_null=True, allow_blank=True)
+
+
+class CashierSaleBatchSerializer(serializers.Serializer):
+    sales = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=1000)
 
 
 class SwaggerCashierTokenObtainSlidingSerializer(serializers.Serializer):
@@ -96,6 +107,7 @@ class SwaggerCashierPreSaleSerializerResponse(serializers.Serializer):
     points_used = serializers.IntegerField()
     after_sale_balance = serializers.IntegerField()
     points_earn = serializers.DecimalField(max_digits=8, decimal_places=2)
+    quote_token = serializers.CharField()
 
 
 class SwaggerCashierSaleSerializer(serializers.Serializer):
@@ -109,4 +121,18 @@ class SwaggerCashierSaleSerializer(serializers.Serializer):
     total_price = serializers.DecimalField(max_digits=8, decimal_places=2)
     points_used = serializers.IntegerField()
     client_id = serializers.IntegerField(allow_null=True)
+    quote_token = serializers.CharField(required=False)
+
+
+class SwaggerCashierSaleBatchSerializer(serializers.Serializer):
+    sales = serializers.ListField(child=CashierBatchSaleSerializer(), min_length=1, max_length=1000)
+
+
+class SwaggerCashierSaleBatchSerializerResponse(serializers.Serializer):
+    class SwaggerCashierSaleBatchSerializerResponseChild(serializers.Serializer):
+        index = serializers.IntegerField()
+        status = serializers.ChoiceField(choices=("ok", "replayed", "error"))
+        transaction_id = serializers.IntegerField(required=False)
+        errors = serializers.DictField(required=False)
 
+    results = serializers.ListField(child=SwaggerCashierSaleBatchSerializerResponseChild())
@@ -0,0 +1,193 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from client_loyalty.cache import bump_client_loyalty_version
+from client_loyalty.exceptions import InsufficientPoints
+from client_loyalty.models import ClientLoyalty, PointsLedger
+from clients.models import Client
+from companies.cache import get_company_settings
+from companies.stats import record_transactions
+from items.prices import get_price_table
+from items.stats import record_transaction_items
+from transaction_items.models import TransactionItem
+from transactions.models import Transaction
+from .quotes import earned_points, load_quote
+from .serializers import CashierBatchSaleSerializer
+
+
+def resolve_sale(data, company_id, company_settings):
+    """Берет суммы и баллы из токена расчета, а без него считает начисление по настройкам компании."""
+    if data.get("quote_token"):
+        return data | load_quote(data["quote_token"], company_id, data["client_id"])
+
+    points_earned = earned_points(data["total_price_with_sale"], company_settings["bonus_points_ratio"]) \
+        if data["client_id"] else 0
+    return data | {"points_earned": points_earned}
+
+
+class Sale:
+    """Несохраненная продажа: транзакция, ее позиции и запись журнала баллов."""
+
+    def __init__(self, cashier_id, company_id, data, prices, idempotency_key=None):
+        self.points_used = data["points_used"]
+        self.points_earned = data["points_earned"]
+
+        self.transaction = Transaction(
+            client_id=data["client_id"],
+            company_id=company_id,
+            cashier_id=cashier_id,
+            price=data["total_price"],
+            price_with_sale=data["total_price_with_sale"],
+            points_used=self.points_used,
+            points_earned=self.points_earned,
+            idempotency_key=idempotency_key or None,
+        )
+        self.items = [
+            TransactionItem(
+                transaction=self.transaction,
+                item_id=item["item_id"],
+                quantity=item["quantity"],
+                sell_price=item["sell_price"],
+                origin_price=prices[item["item_id"]],
+            )
+            for item in data["items"]
+        ]
+
+    @property
+    def client_id(self):
+        return self.transaction.client_id
+
+    @property
+    def points_delta(self):
+        return self.points_earned if self.points_used == 0 else -self.points_used
+
+
+def save_sales(sales):
+    """Записывает продажи фиксированным числом INSERT независимо от их количества.
+
+    Баланс клиентов, журнал баллов и дневные итоги не меняются: это делает вызывающий код.
+    """
+    Transaction.objects.bulk_create([sale.transaction for sale in sales])
+    TransactionItem.objects.bulk_create([item for sale in sales for item in sale.items])
+
+
+def save_rollups(sales):
+    """Прибавляет продажи к дневным итогам компании и товаров; вызывается последним шагом транзакции.
+
+    Обе продажи — одиночная и пачкой — сначала блокируют строки лояльности и только потом строки
+    итогов, в порядке их ключей, поэтому не взаимоблокируются. Общая для компании строка дня
+    держится только до коммита, который следует сразу за ней.
+    """
+    record_transactions([sale.transaction for sale in sales])
+    record_transaction_items([item for sale in sales for item in sale.items])
+
+
+def save_ledger(sales):
+    """Записывает операции журнала баллов; строки лояльности клиентов уже должны быть заблокированы.
+
+    Под блокировкой id операций одного клиента в компании фиксируются строго по возрастанию,
+    поэтому снимок по максимальному видимому id не пропустит незакоммиченную операцию с меньшим id.
+    """
+    PointsLedger.objects.bulk_create([
+        PointsLedger.for_sale(sale.transaction, sale.points_used, sale.points_earned)
+        for sale in sales if sale.client_id
+    ])
+
+
+def sell_batch(cashier_id, company_id, payloads):
+    """Проводит пачку продаж кассира и возвращает результат по каждой в порядке запроса.
+
+    Продажи проверяются вместе: цены берутся из одной таблицы компании, балансы всех клиентов
+    читаются и блокируются одним запросом, а запись идет несколькими bulk-запросами.
+    Некорректная продажа не мешает остальным.
+    """
+    results = [None] * len(payloads)
+    checked = [CashierBatchSaleSerializer(data=payload) for payload in payloads]
+    prices = get_price_table(company_id, {
+        item["item_id"] for serializer in checked if serializer.is_valid()
+        for item in serializer.validated_data["items"]
+    })
+    company_settings = get_company_settings(company_id)
+
+    valid = []
+    for index, serializer in enumerate(checked):
+        if serializer.errors:
+            results[index] = {"index": index, "status": "error", "errors": serializer.errors}
+        elif any(item["item_id"] not in prices for item in serializer.validated_data["items"]):
+            results[index] = {"index": index, "status": "error", "errors": {"detail": "Item not found"}}
+        else:
+            try:
+                valid.append((index, resolve_sale(serializer.validated_data, company_id, company_settings)))
+            except ValidationError as e:
+                results[index] = {"index": index, "status": "error", "errors": e.detail}
+
+    keys = {data.get("idempotency_key") for _, data in valid} - {None, ""}
+    client_ids = set(Client.objects.filter(
+        id__in={data["client_id"] for _, data in valid if data["client_id"]},
+    ).values_list("id", flat=True))
+
+    with transaction.atomic():
+        processed = dict(Transaction.objects.filter(
+            cashier_id=cashier_id, idempotency_key__in=keys,
+        ).values_list("idempotency_key", "id"))
+
+        # Первая покупка клиента в компании заводит ему нулевой баланс
+        ClientLoyalty.objects.bulk_create(
+            [ClientLoyalty(client_id=client_id, company_id=company_id) for client_id in client_ids],
+            ignore_conflicts=True,
+        )
+        # Строки блокируются в порядке id, чтобы параллельные пачки не взаимоблокировались
+        loyalties = {
+            loyalty.client_id: loyalty
+            for loyalty in ClientLoyalty.objects.select_for_update().filter(
+                company_id=company_id, client_id__in=client_ids,
+            ).order_by("id")
+        }
+
+        sales = {}
+        batch_keys = {}
+        for index, data in valid:
+            key = data.get("idempotency_key")
+            if key in processed or key in batch_keys:
+                continue
+
+            loyalty = loyalties.get(data["client_id"])
+            if data["client_id"] and loyalty is None:
+                results[index] = {"index": index, "status": "error", "errors": {"detail": "Not found."}}
+                continue
+            if loyalty is not None and loyalty.points < data["points_used"]:
+                results[index] = {"index": index, "status": "error",
+                                  "errors": {"detail": InsufficientPoints.default_detail}}
+                continue
+
+            sale = Sale(cashier_id, company_id, data, prices, key)
+            if loyalty is not None:
+                loyalty.points += sale.points_delta
+            sales[index] = sale
+            if key:
+                batch_keys[key] = sale
+
+        save_sales(list(sales.values()))
+        save_ledger(list(sales.values()))
+        for sale in sales.values():
+            if sale.client_id:
+                loyalties[sale.client_id].record_visit(sale.transaction.price_with_sale, sale.points_used,
+                                                       max(sale.points_delta, 0), sale.transaction.created_at)
+        ClientLoyalty.objects.bulk_update(
+            list({sale.client_id: loyalties[sale.client_id] for sale in sales.values() if sale.client_id}.values()),
+            ["points", "visits_count", "total_spent", "points_used_total", "points_earned_total",
+             "first_visit_at", "last_visit_at"],
+        )
+        save_rollups(list(sales.values()))
+        bump_client_loyalty_version({sale.client_id for sale in sales.values() if sale.client_id})
+
+    for index, data in valid:
+        key = data.get("idempotency_key")
+        if index in sales:
+            results[index] = {"index": index, "status": "ok", "transaction_id": sales[index].transaction.id}
+        elif key in processed:
+            results[index] = {"index": index, "status": "replayed", "transaction_id": processed[key]}
+        elif key in batch_keys:
+            results[index] = {"index": index, "status": "replayed", "transaction_id": batch_keys[key].transaction.id}
+
+    return results
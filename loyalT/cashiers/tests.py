@@ -1,8 +1,33 @@
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
 import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import SlidingToken
+from cashiers.models import Cashier
 from cashiers.serializers import CashierSerializer, CashierPreSaleSerializer, CashierSaleSerializer, \
     CashierItemSerializer
+from client_loyalty.models import ClientLoyalty, PointsLedger, PointsSnapshot
+from client_loyalty.services import ledger_balance
+from companies.models import CompanyDailyStats
+from companies.stats import cashier_leaderboard, record_transactions
+from items.models import Item
+from transaction_items.models import TransactionItem
+from transactions.models import Transaction
+from users.auth.blacklist import revoked_tokens
+from utils.idempotency import IdempotencyStore
+from utils.singleflight import SingleFlight
+from cashiers.views import sell_responses
 
 
 @pytest.mark.django_db
@@ -17,6 +42,7 @@ class CompanyTests(APITestCase):
         self.create_client_url = '/api/client/register/'
         self.create_items_url = '/api/company/{company_id}/item/'
         self.cashier_sell_url = '/api/cashier/sell/'
+        self.cashier_sell_batch_url = '/api/cashier/sell/batch/'
 
     def init_data(self):
         payload = {
@@ -157,6 +183,599 @@ class CompanyTests(APITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
 
+    def create_item(self, company_id, company_token, price=200):
+        response = self.client.post(self.create_items_url.format(company_id=company_id),
+                                    data={"name": "Латте", "price": price},
+                                    headers={"Authorization": "Bearer " + company_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json().get('id')
+
+    def sell(self, cashier_token, items, client_id=None, points_used=0, headers=None):
+        total_price = sum(int(item["sell_price"]) * item["quantity"] for item in items)
+        payload = {
+            "items": items,
+            "total_price_with_sale": total_price - points_used,
+            "total_price": total_price,
+            "points_used": points_used,
+            "client_id": client_id
+        }
+        return self.client.post(
+            path=self.cashier_sell_url,
+            data=payload,
+            headers={"Authorization": "Bearer " + cashier_token} | (headers or {}),
+            format="json"
+        )
+
+    def test_cashier_sell_item_of_other_company(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+
+        response = self.client.post(self.create_company_url, {
+            "username": "test_company2",
+            "name": "Other Company",
+            "password": "Password1!"
+        }, format='json')
+        other_company = response.json()
+        other_item_id = self.create_item(other_company['company_id'], other_company['token'])
+
+        response = self.sell(cashier_token, [{"item_id": other_item_id, "quantity": 1, "sell_price": "200"}])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(TransactionItem.objects.exists())
+
+    def test_cashier_sell_constant_queries(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        item_ids = [self.create_item(company_id, company_token) for _ in range(5)]
+
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}])
+
+        with CaptureQueriesContext(connection) as one_line:
+            response = self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as many_lines:
+            response = self.sell(
+                cashier_token,
+                [{"item_id": i, "quantity": 2, "sell_price": "200"} for i in item_ids]
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(one_line), len(many_lines))
+
+    def test_cashier_sell_uses_updated_price(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}])
+
+        response = self.client.patch(self.create_items_url.format(company_id=company_id) + f'{item_id}/',
+                                     data={"name": "Капучино", "price": 250},
+                                     headers={"Authorization": "Bearer " + company_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "250"}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(TransactionItem.objects.latest('id').origin_price, 250)
+
+    def test_cashier_sell_reloads_price_table_for_unknown_item(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}])
+
+        # Товар создан мимо сброса кэша, как в другом воркере: таблица цен о нем не знает
+        new_item = Item.objects.create(company_id=company_id, name="Латте", price=300)
+        response = self.sell(cashier_token, [{"item_id": str(new_item.id), "quantity": 1, "sell_price": "300"}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(TransactionItem.objects.latest('id').origin_price, 300)
+
+
+    def test_cashier_sell_insufficient_points(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        ClientLoyalty.objects.create(client_id=client_id, company_id=company_id, points=50)
+        PointsSnapshot.objects.create(client_id=client_id, company_id=company_id, balance=50, last_entry_id=0)
+
+        response = self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}],
+                             client_id=client_id, points_used=60)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['detail'], 'Insufficient points')
+        self.assertFalse(Transaction.objects.exists())
+
+        response = self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}],
+                             client_id=client_id, points_used=50)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ClientLoyalty.objects.get(client_id=client_id, company_id=company_id).points, 0)
+        self.assertEqual(PointsLedger.objects.get().delta, -50)
+        self.assertEqual(ledger_balance(client_id, company_id), 0)
+
+    def test_cashier_sell_idempotency_key(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        ClientLoyalty.objects.create(client_id=client_id, company_id=company_id)
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+
+        first = self.sell(cashier_token, items, client_id=client_id, headers={"Idempotency-Key": "sale-1"})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+        retry = self.sell(cashier_token, items, client_id=client_id, headers={"Idempotency-Key": "sale-1"})
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+
+        # Другой воркер не видит ответ в памяти, но уникальный ключ в базе не даст продать дважды
+        sell_responses._entries.clear()
+        retry = self.sell(cashier_token, items, client_id=client_id, headers={"Idempotency-Key": "sale-1"})
+        self.assertEqual(retry.json(), first.json())
+
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(PointsLedger.objects.count(), 1)
+        self.assertEqual(ClientLoyalty.objects.get(client_id=client_id, company_id=company_id).points, 40)
+
+        response = self.sell(cashier_token, items, client_id=client_id, headers={"Idempotency-Key": "sale-2"})
+        self.assertNotEqual(response.json(), first.json())
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+    def test_cashier_sell_batch(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        ClientLoyalty.objects.create(client_id=client_id, company_id=company_id, points=10)
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        self.sell(cashier_token, items, client_id=client_id, headers={"Idempotency-Key": "offline-0"})
+
+        def sale(points_used=0, key=None, client=client_id):
+            return {"items": items, "total_price": 200, "total_price_with_sale": 200 - points_used,
+                    "points_used": points_used, "client_id": client, "idempotency_key": key}
+
+        sales = [
+            sale(key="offline-0"),
+            sale(key="offline-1"),
+            sale(points_used=80, key="offline-2"),
+            sale(points_used=80, key="offline-3"),
+            sale(key="offline-1"),
+            sale(client=None),
+            {"items": items, "total_price": "abc"},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.cashier_sell_batch_url, {"sales": sales},
+                                        headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+        results = response.json()['results']
+
+        self.assertEqual([r['status'] for r in results],
+                         ["replayed", "ok", "ok", "error", "replayed", "ok", "error"])
+        self.assertEqual(results[4]['transaction_id'], results[1]['transaction_id'])
+        self.assertEqual(results[3]['errors']['detail'], 'Insufficient points')
+        self.assertIn('total_price', results[6]['errors'])
+
+        # 10 + 40 за первую продажу + 40 - 80
+        self.assertEqual(ClientLoyalty.objects.get(client_id=client_id, company_id=company_id).points, 10)
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(PointsLedger.objects.count(), 3)
+        self.assertLess(len(queries), 20)
+
+    def test_cashier_pre_sale_quote_token(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        items = [{"item_id": item_id, "quantity": 2, "sell_price": "200"}]
+
+        response = self.client.post(self.cashier_pre_sale_url, {'client_id': client_id, 'total_price': 400},
+                                    headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(ClientLoyalty.objects.exists())
+        quote_token = response.json()['quote_token']
+
+        payload = {"items": items, "total_price": 1, "total_price_with_sale": 1, "points_used": 0,
+                   "client_id": client_id, "quote_token": quote_token + "x"}
+        response = self.client.post(self.cashier_sell_url, payload,
+                                    headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.cashier_sell_url, payload | {"quote_token": quote_token, "client_id": 1},
+                                    headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.cashier_sell_url, payload | {"quote_token": quote_token},
+                                    headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
+
+        transaction_obj = Transaction.objects.get()
+        self.assertEqual(transaction_obj.price, 400)
+        self.assertEqual(transaction_obj.price_with_sale, 400)
+        self.assertEqual(transaction_obj.points_earned, 80)
+        self.assertEqual(ClientLoyalty.objects.get(client_id=client_id, company_id=company_id).points, 80)
+
+    def test_cashier_token_claims_resolve_principal_without_queries(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        # Версия токенов пользователя читается из базы один раз и дальше берется из кэша
+        self.client.post(self.cashier_pre_sale_url, {'client_id': client_id, 'total_price': 100},
+                         headers={"Authorization": "Bearer " + cashier_token}, format="json")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.cashier_pre_sale_url, {'client_id': client_id, 'total_price': 100},
+                                        headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tables = " ".join(query['sql'] for query in queries)
+        self.assertNotIn('"users_user"', tables)
+        self.assertNotIn('"cashiers_cashier"', tables)
+
+        # Токен без claims, выданный до их появления, по-прежнему принимается
+        legacy_token = str(SlidingToken.for_user(Cashier.objects.get(id=cashier_id).user))
+        response = self.client.post(self.cashier_pre_sale_url, {'client_id': client_id, 'total_price': 100},
+                                    headers={"Authorization": "Bearer " + legacy_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.cashier_pre_sale_url, {'client_id': client_id, 'total_price': 100},
+                                        headers={"Authorization": "Bearer " + legacy_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('"users_user"', " ".join(query['sql'] for query in queries))
+
+        response = self.client.post(self.cashier_pre_sale_url, {'client_id': client_id, 'total_price': 100},
+                                    headers={"Authorization": "Bearer " + company_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revoked_tokens_checked_in_memory(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        payload = {'client_id': client_id, 'total_price': 100}
+        headers = {"Authorization": "Bearer " + cashier_token}
+
+        revoked_tokens.refresh()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.cashier_pre_sale_url, payload, headers=headers, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('token_blacklist', " ".join(query['sql'] for query in queries))
+
+        # Отзыв в другом воркере: строка появляется без сигнала и подгружается при обновлении кэша
+        jti = SlidingToken(cashier_token)['jti']
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=jti))])
+        revoked_tokens.refresh()
+        response = self.client.post(self.cashier_pre_sale_url, payload, headers=headers, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_daily_stats_rollup(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        self.sell(cashier_token, items, client_id=client_id)
+        self.sell(cashier_token, items)
+        self.client.post(self.cashier_sell_batch_url, {"sales": [
+            {"items": items, "total_price": 200, "total_price_with_sale": 200, "points_used": 0, "client_id": None},
+        ]}, headers={"Authorization": "Bearer " + cashier_token}, format="json")
+
+        today = str(timezone.localdate())
+        period = {"from_date": today, "to_date": today}
+        headers = {"Authorization": "Bearer " + company_token}
+        expected = self.client.post('/api/company/stats/money/daily/', period, headers=headers, format="json").json()
+        self.assertEqual(expected, [{"day": today, "total_points_earned": 40, "total_price": 600.0}])
+
+        stats = self.client.post('/api/client/stats/amount/', period, headers=headers, format="json").json()[0]
+        self.assertEqual((stats['all_transactions_count'], stats['all_loyal'], stats['all_no_loyal']), (3, 1, 2))
+
+        month_start = str(timezone.localdate().replace(day=1))
+        stats = self.client.post('/api/client/stats/amount/', period | {"granularity": "month"},
+                                 headers=headers, format="json").json()[0]
+        self.assertEqual(stats['result'], [{"date": month_start, "transactions_count": 3, "loyal": 1, "no_loyal": 2}])
+        response = self.client.post('/api/client/stats/amount/', period | {"granularity": "year"},
+                                    headers=headers, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        CompanyDailyStats.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_company_daily_stats', stdout=StringIO())
+        response = self.client.post('/api/company/stats/money/daily/', period, headers=headers, format="json")
+        self.assertEqual(response.json(), expected)
+
+    def test_hourly_stats_and_heatmap(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        self.sell(cashier_token, items)
+        self.sell(cashier_token, items)
+        now = timezone.localtime()
+        headers = {"Authorization": "Bearer " + company_token}
+
+        hours = self.client.post('/api/company/stats/money/', {"date": str(now.date())},
+                                 headers=headers, format="json").json()
+        self.assertEqual(len(hours), 24)
+        self.assertEqual([hour["total_price"] for hour in hours if hour["total_price"]], [400])
+        self.assertEqual(hours[now.hour]["total_price"], 400)
+
+        response = self.client.post('/api/company/stats/money/', {
+            "mode": "heatmap", "from_date": str(now.date() - timedelta(days=7)), "to_date": str(now.date()),
+        }, headers=headers, format="json")
+        heatmap = response.json()
+        self.assertEqual([row["weekday"] for row in heatmap], list(range(1, 8)))
+        cell = heatmap[now.isoweekday() - 1]["hours"][now.hour]
+        self.assertEqual((cell["transactions_count"], cell["total_price"]), (2, 400))
+
+    def test_cashier_stats_and_leaderboard(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        second_token = self.client.post(self.create_cashier_url.format(company_id=company_id), {
+            "username": "test_cashier2", "password": "Password2!",
+        }, headers={"Authorization": "Bearer " + company_token}).json()["token"]
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        self.sell(cashier_token, items)
+        self.sell(second_token, items)
+        self.sell(second_token, items * 2)
+        today = str(timezone.localdate())
+        payload = {"from_date": today, "to_date": today}
+        headers = {"Authorization": "Bearer " + company_token}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/company/stats/money/cashier/daily/', payload,
+                                        headers=headers, format="json")
+        self.assertEqual(len([query for query in queries if 'transactions_transaction' in query['sql']]), 1)
+        self.assertEqual(sorted(stat["cashier_name"] for stat in response.json()), ["test_cashier1", "test_cashier2"])
+
+        leaderboard = self.client.post('/api/company/stats/money/cashier/daily/', payload | {"mode": "leaderboard"},
+                                       headers=headers, format="json").json()
+        self.assertEqual([row["cashier_name"] for row in leaderboard], ["test_cashier2", "test_cashier1"])
+        self.assertEqual((leaderboard[0]["total_price"], leaderboard[0]["transactions_count"]), (600, 2))
+        self.assertEqual((leaderboard[0]["revenue_rank"], leaderboard[0]["average_ticket_rank"]), (1, 1))
+        self.assertEqual(leaderboard[1]["average_ticket_rank"], 2)
+
+    def test_sales_lock_loyalty_before_daily_rollups(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+
+        def lock_order(send):
+            with CaptureQueriesContext(connection) as queries:
+                send()
+            sql = [query['sql'] for query in queries]
+            loyalty = min(index for index, statement in enumerate(sql) if 'client_loyalty_clientloyalty' in statement
+                          and ('FOR UPDATE' in statement or statement.startswith('UPDATE')))
+            rollups = [index for index, statement in enumerate(sql)
+                       if 'companies_companydailystats' in statement or 'items_itemdailystats' in statement]
+            return loyalty < min(rollups)
+
+        # Одиночная продажа и пачка блокируют строки в одном порядке: сначала лояльность, затем итоги дня
+        self.assertTrue(lock_order(lambda: self.sell(cashier_token, items, client_id=client_id)))
+        self.assertTrue(lock_order(lambda: self.client.post(self.cashier_sell_batch_url, {"sales": [
+            {"items": items, "total_price": 200, "total_price_with_sale": 200, "points_used": 0,
+             "client_id": client_id},
+        ]}, headers={"Authorization": "Bearer " + cashier_token}, format="json")))
+
+    def test_stats_cache_versioned_by_sales(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        today = timezone.localdate()
+        headers = {"Authorization": "Bearer " + company_token}
+
+        def daily(from_date, to_date):
+            return self.client.post('/api/company/stats/money/daily/',
+                                    {"from_date": str(from_date), "to_date": str(to_date)},
+                                    headers=headers, format="json").json()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(cashier_token, items)
+        self.assertEqual(daily(today, today)[0]["total_price"], 200)
+        with CaptureQueriesContext(connection) as queries:
+            daily(today, today)
+        self.assertNotIn('companies_companydailystats', " ".join(query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(cashier_token, items)
+        self.assertEqual(daily(today, today)[0]["total_price"], 400)
+
+        yesterday = today - timedelta(days=1)
+        self.assertEqual(daily(yesterday, yesterday), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(cashier_token, items)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(daily(yesterday, yesterday), [])
+        self.assertNotIn('companies_companydailystats', " ".join(query['sql'] for query in queries))
+
+    def test_stats_sale_recomputes_only_today(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        past = CompanyDailyStats.objects.create(company_id=company_id, day=yesterday, total_price=500,
+                                                transactions_count=1, no_loyal_count=1)
+        headers = {"Authorization": "Bearer " + company_token}
+
+        def daily():
+            response = self.client.post('/api/company/stats/money/daily/',
+                                        {"from_date": str(yesterday), "to_date": str(today)},
+                                        headers=headers, format="json")
+            return [(row["day"], row["total_price"]) for row in response.json()]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(cashier_token, items)
+        self.assertEqual(daily(), [(str(today), 200), (str(yesterday), 500)])
+
+        # Срез прошедших дней не пересчитывается после продажи
+        CompanyDailyStats.objects.filter(id=past.id).update(total_price=900)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(cashier_token, items)
+        self.assertEqual(daily(), [(str(today), 400), (str(yesterday), 500)])
+
+        # Продажа, попавшая во вчерашний день, и пересборка итогов сдвигают версию истории
+        with self.captureOnCommitCallbacks(execute=True):
+            record_transactions([Transaction(company_id=company_id, client_id=None, price=100, points_earned=0,
+                                             created_at=timezone.now() - timedelta(days=1))])
+        self.assertEqual(daily(), [(str(today), 400), (str(yesterday), 1000)])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_company_daily_stats', stdout=StringIO())
+        self.assertEqual(daily(), [(str(today), 400)])
+
+    def test_transactions_export_streams_csv_and_ndjson(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 2, "sell_price": "200"}], client_id=client_id)
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}])
+        self.assertEqual(self.sell(cashier_token, []).status_code, status.HTTP_200_OK)
+        headers = {"Authorization": "Bearer " + company_token}
+
+        response = self.client.get('/api/company/transactions/export/', headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["transaction_id", "created_at"])
+        self.assertEqual(len(lines), 4)
+        # Продажа без позиций выгружается одной строкой с пустыми полями позиции
+        self.assertEqual(lines[3].split(",")[-4:], ["", "", "", ""])
+
+        today = str(timezone.localdate())
+        response = self.client.get('/api/company/transactions/export/',
+                                   {"export_format": "ndjson", "from_date": today, "to_date": today}, headers=headers)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["quantity"] for row in rows], [2, 1, None])
+        self.assertEqual(rows[0]["client_id"], client_id)
+        self.assertIsNone(rows[1]["client_id"])
+
+        response = self.client.get('/api/company/transactions/export/', {"export_format": "xml"}, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_item_stats_from_daily_rollup(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        cheap_item_id = self.create_item(company_id, company_token, price=100)
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 2, "sell_price": "150"},
+                                  {"item_id": cheap_item_id, "quantity": 6, "sell_price": "100"}])
+        self.sell(cashier_token, [{"item_id": item_id, "quantity": 1, "sell_price": "200"}])
+        today = str(timezone.localdate())
+        headers = {"Authorization": "Bearer " + company_token}
+
+        def item_stats():
+            return self.client.post('/api/company/stats/items/', {"from_date": today, "to_date": today, "limit": 5},
+                                    headers=headers, format="json").json()
+
+        stats = item_stats()
+        self.assertEqual([item["item_id"] for item in stats["top_by_revenue"]], [cheap_item_id, item_id])
+        self.assertEqual([item["item_id"] for item in stats["top_by_quantity"]], [cheap_item_id, item_id])
+        self.assertEqual(stats["top_by_revenue"][1]["quantity"], 3)
+        self.assertEqual(stats["top_by_revenue"][1]["average_discount"], 0.1667)
+        self.assertEqual(stats["average_discount"], 0.0833)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_item_daily_stats', stdout=StringIO())
+        self.assertEqual(item_stats(), stats)
+
+    def test_client_lifetime_stats_and_top_clients(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        other_client_id = self.client.post(self.create_client_url, {'id': 12345, 'first_name': 'Jane'},
+                                           format='json').json()['id']
+        items = [{"item_id": item_id, "quantity": 1, "sell_price": "200"}]
+        self.sell(cashier_token, items, client_id=client_id)
+        self.sell(cashier_token, items, client_id=client_id, points_used=30)
+        self.client.post(self.cashier_sell_batch_url, {"sales": [
+            {"items": items * 3, "total_price": 600, "total_price_with_sale": 600, "points_used": 0,
+             "client_id": other_client_id},
+        ]}, headers={"Authorization": "Bearer " + cashier_token}, format="json")
+
+        loyalty = ClientLoyalty.objects.get(client_id=client_id, company_id=company_id)
+        self.assertEqual((loyalty.visits_count, loyalty.total_spent), (2, 370))
+        self.assertEqual((loyalty.points_earned_total, loyalty.points_used_total, loyalty.points), (40, 30, 10))
+        self.assertLessEqual(loyalty.first_visit_at, loyalty.last_visit_at)
+
+        headers = {"Authorization": "Bearer " + company_token}
+        top = self.client.get('/api/client/stats/top/', headers=headers).json()
+        self.assertEqual([row["client_id"] for row in top], [other_client_id, client_id])
+        self.assertEqual(top[0]["first_name"], "Jane")
+        top = self.client.get('/api/client/stats/top/', {"order_by": "visits_count", "limit": 1}, headers=headers)
+        self.assertEqual([row["client_id"] for row in top.json()], [client_id])
+        tomorrow = str(timezone.localdate() + timedelta(days=1))
+        top = self.client.get('/api/client/stats/top/', {"last_visit_before": tomorrow}, headers=headers).json()
+        self.assertEqual(len(top), 2)
+        top = self.client.get('/api/client/stats/top/', {"last_visit_before": str(timezone.localdate())},
+                              headers=headers).json()
+        self.assertEqual(top, [])
+
+    def test_deactivated_cashier_tokens_revoked(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        other_device_token = self.client.post(self.cashier_login_url, {
+            "username": "test_cashier1", "password": "Password2!", "user_type": "Cashier",
+        }, format="json").json()["token"]
+        payload = {'client_id': 1, 'total_price': 100}
+
+        response = self.client.delete(f"{self.create_cashier_url.format(company_id=company_id)}{cashier_id}/",
+                                      headers={"Authorization": "Bearer " + company_token})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        for token in (cashier_token, other_device_token):
+            response = self.client.post(self.cashier_pre_sale_url, payload,
+                                        headers={"Authorization": "Bearer " + token}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(self.cashier_login_url, {
+            "username": "test_cashier1", "password": "Password2!", "user_type": "Cashier",
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_all_revokes_every_token(self):
+        company_id, company_token, cashier_id, cashier_token, item_id = self.init_data()
+        client_id, client_first_name = self.init_client()
+        payload = {'client_id': client_id, 'total_price': 100}
+
+        response = self.client.post('/api/cashier/logout/all/', headers={"Authorization": "Bearer " + cashier_token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(self.cashier_pre_sale_url, payload,
+                                    headers={"Authorization": "Bearer " + cashier_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        new_token = self.client.post(self.cashier_login_url, {
+            "username": "test_cashier1", "password": "Password2!", "user_type": "Cashier",
+        }, format="json").json()["token"]
+        response = self.client.post(self.cashier_pre_sale_url, payload,
+                                    headers={"Authorization": "Bearer " + new_token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post('/api/company/logout/all/', headers={"Authorization": "Bearer " + company_token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/company/stats/money/daily/',
+                                   headers={"Authorization": "Bearer " + company_token})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class IdempotencyStoreTests(SimpleTestCase):
+    def test_ttl_and_bound(self):
+        store = IdempotencyStore(max_entries=2, ttl=60)
+        store.set("a", 1)
+        store.set("b", 2)
+        store.set("c", 3)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.get("c"), 3)
+        self.assertEqual(len(store), 2)
+
+        store = IdempotencyStore(max_entries=10, ttl=0)
+        store.set("a", 1)
+        self.assertIsNone(store.get("a"))
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_misses_compute_once(self):
+        flights = SingleFlight()
+        results = {}
+        calls = []
+        started = threading.Barrier(4)
+
+        def load():
+            started.wait()
+            with flights.lock("key"):
+                if "key" not in results:
+                    calls.append(1)
+                    time.sleep(0.05)
+                    results["key"] = 1
+
+        threads = [threading.Thread(target=load) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(flights), 0)
+
+class CashierLeaderboardTests(SimpleTestCase):
+    def test_ranks_follow_sql_rank(self):
+        rows = [
+            {'cashier_id': cashier_id, 'cashier_name': name, 'total_price': price, 'total_points_earned': points,
+             'transactions_count': count}
+            for cashier_id, name, price, points, count in ((1, 'b', 600, 10, 2), (2, 'a', 600, 30, 3),
+                                                           (3, 'c', 100, 30, 1))
+        ]
+        leaderboard = cashier_leaderboard(rows)
+        self.assertEqual([(row['cashier_name'], row['revenue_rank']) for row in leaderboard],
+                         [('a', 1), ('b', 1), ('c', 3)])
+        self.assertEqual([row['points_rank'] for row in leaderboard], [1, 3, 1])
+        self.assertEqual([row['average_ticket_rank'] for row in leaderboard], [2, 1, 3])
+
 
 class CashierSerializerTests(APITestCase):
     def setUp(self):
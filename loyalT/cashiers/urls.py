@@ -1,11 +1,13 @@
 from django.urls import path
 
-from .views import CashierTokenObtainSlidingView, CashierLogoutAPIView, CashierPreSaleAPI
-from .views import CashierSell
+from .views import CashierTokenObtainSlidingView, CashierLogoutAPIView, CashierLogoutAllAPIView, CashierPreSaleAPI
+from .views import CashierSell, CashierSellBatch
 
 urlpatterns = [
     path('login/', CashierTokenObtainSlidingView.as_view(), name='cashier-login'),
     path('logout/', CashierLogoutAPIView.as_view(), name='cashier-logout'),
+    path('logout/all/', CashierLogoutAllAPIView.as_view(), name='cashier-logout-all'),
     path('pre-sale/', CashierPreSaleAPI.as_view(), name='cashier-pre-sale'),
-    path('sell/', CashierSell.as_view(), name='cashier-sell')
+    path('sell/', CashierSell.as_view(), name='cashier-sell'),
+    path('sell/batch/', CashierSellBatch.as_view(), name='cashier-sell-batch'),
 ]
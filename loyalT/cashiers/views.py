@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -10,15 +13,21 @@ from rest_framework_simplejwt.views import TokenObtainSlidingView
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 
 from clients.models import Client
-from items.models import Item
-from transaction_items.models import TransactionItem
+from companies.cache import get_company_settings
+from items.prices import get_price_table
 from .models import Cashier
+from .quotes import make_quote
+from .services import Sale, resolve_sale, save_ledger, save_rollups, save_sales, sell_batch
 from .serializers import CashierTokenObtainSlidingSerializer, CashierPreSaleSerializer, CashierSaleSerializer, \
+    CashierSaleBatchSerializer, SwaggerCashierSaleBatchSerializer, SwaggerCashierSaleBatchSerializerResponse, \
     SwaggerCashierPreSaleSerializer, SwaggerCashierPreSaleSerializerResponse, \
     SwaggerCashierTokenObtainSlidingSerializer, SwaggerCashierTokenObtainSlidingSerializerResponse
 from transactions.models import Transaction
 from client_loyalty.models import ClientLoyalty
-from django.db import transaction
+from client_loyalty.services import apply_points
+from django.db import IntegrityError, transaction
+from users.auth.versions import revoke_user_tokens
+from utils.idempotency import IdempotencyStore
 
 User = get_user_model()
 
@@ -26,6 +35,8 @@ User = get_user_model()
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+sell_responses = IdempotencyStore(max_entries=settings.IDEMPOTENCY_MAX_ENTRIES, ttl=settings.IDEMPOTENCY_KEY_TTL)
+
 class CashierLogoutAPIView(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -45,9 +56,8 @@ class CashierLogoutAPIView(APIView):
     def post(request, *args, **kwargs):
         try:
             jti = request.auth['jti']
-            user = request.user
 
-            outstanding_token = OutstandingToken.objects.get(jti=jti, user=user)
+            outstanding_token = OutstandingToken.objects.get(jti=jti, user_id=request.user.id)
 
             BlacklistedToken.objects.create(token=outstanding_token)
 
@@ -61,6 +71,24 @@ class CashierLogoutAPIView(APIView):
             )
 
 
+class CashierLogoutAllAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @staticmethod
+    @swagger_auto_schema(
+        tags=["Cashier"],
+        operation_id="cashier_logout_all",
+        operation_summary="Выход кассира со всех устройств",
+        operation_description="Инвалидирует все выданные кассиру токены, включая текущий.",
+        responses={
+            200: openapi.Response("Токены успешно инвалидированы"),
+        }
+    )
+    def post(request, *args, **kwargs):
+        revoke_user_tokens(request.user.id)
+        return Response(status=status.HTTP_200_OK)
+
+
 class CashierTokenObtainSlidingView(TokenObtainSlidingView):
     serializer_class = CashierTokenObtainSlidingSerializer
 
@@ -96,8 +124,8 @@ class CashierTokenObtainSlidingView(TokenObtainSlidingView):
 
         return Response(
             serializer.validated_data | {
-                'cashier_id': serializer.user.cashier.id,
-                'company_id': serializer.user.cashier.company.id
+                'cashier_id': serializer.user.cashier_id,
+                'company_id': serializer.user.company_id
             },
             status=status.HTTP_200_OK
         )
@@ -113,7 +141,8 @@ class CashierPreSaleAPI(APIView):
         operation_description='''Расчет пред-продажной скидки на основе 
         бонусных баллов клиента. Входные данные включают сумму покупки и ID клиента. 
         В ответе API возвращает информацию о примененной скидке, оставшемся балансе клиента и окончательной 
-        стоимости покупки.''',
+        стоимости покупки. Расчет ничего не записывает в базу. Поле quote_token из ответа можно передать 
+        в продажу: она возьмет суммы и баллы из токена, не пересчитывая их. Токен действует 10 минут.''',
         request_body=SwaggerCashierPreSaleSerializer,
         responses={
             200: openapi.Response(
@@ -127,29 +156,26 @@ class CashierPreSaleAPI(APIView):
         pre_sale = CashierPreSaleSerializer(data=request.data)
         pre_sale.is_valid(raise_exception=True)
 
-        client = get_object_or_404(Client, id=pre_sale.validated_data['client_id'])
-        company = request.user.cashier.company
-
-        client_loyalty, created = ClientLoyalty.objects.get_or_create(client=client, company=company)
+        if request.user.cashier_id is None:
+            raise PermissionDenied()
 
-        points_used = min(
-            pre_sale.validated_data['total_price'] * company.max_sale, client_loyalty.points
+        client_id = pre_sale.validated_data['client_id']
+        company_id = request.user.company_id
+
+        # Расчет только читает: баланс клиента берется вместе с проверкой его существования
+        balance = Client.objects.filter(id=client_id).annotate(
+            points=Coalesce(Subquery(
+                ClientLoyalty.objects.filter(client_id=OuterRef('id'), company_id=company_id).values('points')[:1]
+            ), 0)
+        ).values_list('points', flat=True).first()
+        if balance is None:
+            raise NotFound("No Client matches the given query.")
+
+        response = make_quote(
+            company_id, client_id, pre_sale.validated_data['total_price'], balance,
+            get_company_settings(company_id),
         )
 
-        price_with_sale = pre_sale.validated_data['total_price'] - points_used
-
-        after_sale_balance = client_loyalty.points - points_used
-
-        points_earn = company.bonus_points_ratio * pre_sale.validated_data['total_price']
-
-        response = {
-            "client_balance": client_loyalty.points,
-            "price_with_sale": price_with_sale,
-            "points_used": points_used,
-            "after_sale_balance": after_sale_balance,
-            'points_earn': points_earn
-        }
-
         return Response(response, status=status.HTTP_200_OK)
 
 
@@ -158,13 +184,24 @@ class CashierSell(APIView):
 
     @swagger_auto_schema(
         tags=["Cashier"],
-        operation_description="Продажа товара и начисление бонусов",
+        operation_description="""Продажа товара и начисление бонусов.
+        Повтор запроса с тем же заголовком Idempotency-Key не создает новую продажу, 
+        а возвращает ответ на первый запрос с заголовком Idempotent-Replayed: true.""",
         operation_summary="Продажа товара и начисление бонусов",
         request_body=CashierSaleSerializer,
+        manual_parameters=[
+            openapi.Parameter(
+                name='Idempotency-Key',
+                in_=openapi.IN_HEADER,
+                description="Уникальный ключ продажи для безопасных повторов",
+                type=openapi.TYPE_STRING,
+                required=False
+            )
+        ],
         responses={
             200: openapi.Response("Продажа успешно завершена"),
             404: openapi.Response("Клиент или товар не найден"),
-            400: openapi.Response("Ошибка при оформлении продажи")
+            400: openapi.Response("Ошибка при оформлении продажи или недостаточно баллов")
         }
     )
     def post(self, request, *args, **kwargs):
@@ -174,49 +211,92 @@ class CashierSell(APIView):
 
         data = serializer.validated_data
 
-        if not hasattr(request.user, 'cashier'):
+        if request.user.cashier_id is None:
+            raise PermissionDenied()
+
+        cashier_id = request.user.cashier_id
+        company_id = request.user.company_id
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            if len(idempotency_key) > 255:
+                raise ValidationError({"Idempotency-Key": "Ensure this header has no more than 255 characters."})
+            replayed = sell_responses.get((cashier_id, idempotency_key))
+            if replayed is not None:
+                return self.replay(replayed)
+
+        data = resolve_sale(data, company_id, get_company_settings(company_id))
+        if data['client_id']:
+            get_object_or_404(Client, id=data['client_id'])
+
+        prices = get_price_table(company_id, [item["item_id"] for item in data["items"]])
+        if any(item["item_id"] not in prices for item in data["items"]):
+            raise NotFound("Item not found")
+
+        sale = Sale(cashier_id, company_id, data, prices, idempotency_key)
+
+        try:
+            with transaction.atomic():
+                save_sales([sale])
+                # Журнал пишется под блокировкой строки лояльности: на этом держатся снимки балансов
+                if sale.client_id:
+                    apply_points(sale.client_id, company_id, sale.points_used, sale.points_earned,
+                                 sale.transaction.price_with_sale, sale.transaction.created_at)
+                    save_ledger([sale])
+                # Итоги дня последними: тот же порядок блокировок, что и в sell_batch
+                save_rollups([sale])
+        except IntegrityError:
+            # Тот же ключ уже обработал другой воркер: уникальный индекс не дал создать вторую продажу
+            transaction_id = Transaction.objects.filter(
+                cashier_id=cashier_id, idempotency_key=idempotency_key
+            ).values_list('id', flat=True).first() if idempotency_key else None
+            if transaction_id is None:
+                raise
+            response = {"transaction_id": transaction_id}
+            sell_responses.set((cashier_id, idempotency_key), response)
+            return self.replay(response)
+
+        response = {"transaction_id": sale.transaction.id}
+        if idempotency_key:
+            sell_responses.set((cashier_id, idempotency_key), response)
+
+        return Response(response, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def replay(response):
+        return Response(response, status=status.HTTP_200_OK, headers={"Idempotent-Replayed": "true"})
+
+
+class CashierSellBatch(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @swagger_auto_schema(
+        tags=["Cashier"],
+        operation_id="cashier_sell_batch",
+        operation_summary="Пакетная синхронизация офлайн-продаж",
+        operation_description="""Проведение до 1000 продаж одним запросом, например после восстановления связи. 
+        Каждая продажа проверяется отдельно и получает свой результат: ok, replayed (продажа с этим 
+        idempotency_key уже проведена) или error. Ошибка в одной продаже не отменяет остальные.""",
+        request_body=SwaggerCashierSaleBatchSerializer,
+        responses={
+            200: openapi.Response("Результаты по каждой продаже", SwaggerCashierSaleBatchSerializerResponse),
+            400: openapi.Response("Некорректный формат пачки"),
+            409: openapi.Response("Пачка конфликтует с параллельно проводимыми продажами, повторите запрос")
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = CashierSaleBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if request.user.cashier_id is None:
             raise PermissionDenied()
 
-        cashier = request.user.cashier
-        company = cashier.company
-
-        client = get_object_or_404(Client, id=data['client_id']) if data['client_id'] else None
-
-        with transaction.atomic():
-            points_earned = int(data["total_price_with_sale"] * company.bonus_points_ratio) if client else 0
-            transaction_obj = Transaction.objects.create(
-                client=client,
-                company=company,
-                cashier=cashier,
-                price=data["total_price"],
-                price_with_sale=data["total_price_with_sale"],
-                points_used=data["points_used"],
-                points_earned=points_earned,
+        try:
+            results = sell_batch(request.user.cashier_id, request.user.company_id, serializer.validated_data['sales'])
+        except IntegrityError:
+            return Response(
+                {"detail": "Продажи с такими ключами идемпотентности уже проводятся, повторите запрос"},
+                status=status.HTTP_409_CONFLICT
             )
-            if client:
-                client_loyalty = get_object_or_404(ClientLoyalty, client_id=data['client_id'], company_id=company.id)
-                if data["points_used"] == 0:
-                    client_loyalty.points += points_earned
-                client_loyalty.points -= data["points_used"]
-                client_loyalty.save()
-
-            item_objects = []
-
-            for item in data["items"]:
-                try:
-                    item_obj = Item.objects.get(id=item["item_id"])
-                except:
-                    raise NotFound("Item not found")
-                item_objects.append(
-                    TransactionItem(
-                        transaction=transaction_obj,
-                        item=item_obj,
-                        quantity=item["quantity"],
-                        sell_price=item["sell_price"],
-                        origin_price=item_obj.price,
-                    )
-                )
-
-            TransactionItem.objects.bulk_create(item_objects)
 
-        return Response(status=status.HTTP_200_OK)
+        return Response({"results": results}, status=status.HTTP_200_OK)
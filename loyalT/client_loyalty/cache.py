@@ -0,0 +1,13 @@
+from companies.cache import CATALOG_VERSION_CACHE_KEY
+from utils.versions import bump_versions
+
+CLIENT_LOYALTY_VERSION_CACHE_KEY = 'client_loyalty:version:{client_id}'
+
+
+def client_loyalty_version_keys(request, client_id, *args, **kwargs):
+    """Ответы клиенту зависят от его балансов и подписок и от данных компаний."""
+    return [CLIENT_LOYALTY_VERSION_CACHE_KEY.format(client_id=client_id), CATALOG_VERSION_CACHE_KEY]
+
+
+def bump_client_loyalty_version(client_ids):
+    bump_versions([CLIENT_LOYALTY_VERSION_CACHE_KEY.format(client_id=client_id) for client_id in client_ids])
@@ -0,0 +1,8 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class InsufficientPoints(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Insufficient points'
+    default_code = 'insufficient_points'
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from client_loyalty.cache import bump_client_loyalty_version
+from client_loyalty.models import ClientLoyalty, PointsLedger, PointsSnapshot
+
+
+class Command(BaseCommand):
+    help = "Снимки балансов по журналу баллов и, по запросу, пересборка ClientLoyalty.points"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-tail', type=int, default=1,
+                            help="Снимок делается, если после предыдущего накопилось не меньше операций")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Записать балансы из журнала в ClientLoyalty.points (при остановленных продажах)")
+
+    def handle(self, *args, **options):
+        latest = PointsSnapshot.objects.filter(
+            client_id=OuterRef('client_id'),
+            company_id=OuterRef('company_id'),
+        ).order_by('-last_entry_id')
+
+        # Фиксируем границу, чтобы операции, пришедшие во время работы, попали в следующий запуск.
+        # Продажа пишет журнал под блокировкой строки лояльности, поэтому у пары клиент-компания
+        # за видимой операцией не может позже закоммититься операция с меньшим id
+        watermark = PointsLedger.objects.aggregate(last=Max('id'))['last'] or 0
+
+        tails = PointsLedger.objects.filter(id__lte=watermark).annotate(
+            snapshot_entry_id=Coalesce(Subquery(latest.values('last_entry_id')[:1]), 0),
+            snapshot_balance=Coalesce(Subquery(latest.values('balance')[:1]), 0),
+        ).filter(
+            id__gt=F('snapshot_entry_id'),
+        ).values(
+            'client_id', 'company_id', 'snapshot_balance',
+        ).annotate(
+            tail=Sum('delta'),
+            tail_size=Count('id'),
+            last_entry_id=Max('id'),
+        ).filter(tail_size__gte=1 if options['rebuild'] else options['min_tail'])
+
+        snapshots = [
+            PointsSnapshot(
+                client_id=row['client_id'],
+                company_id=row['company_id'],
+                balance=row['snapshot_balance'] + row['tail'],
+                last_entry_id=row['last_entry_id'],
+            )
+            for row in tails.iterator()
+        ]
+
+        with transaction.atomic():
+            PointsSnapshot.objects.bulk_create(snapshots, batch_size=options['batch_size'])
+            pruned, _ = PointsSnapshot.objects.exclude(
+                id=Subquery(latest.values('id')[:1]),
+            ).delete()
+
+        self.stdout.write(f"snapshots created: {len(snapshots)}, pruned: {pruned}, watermark: {watermark}")
+
+        if options['rebuild']:
+            self.rebuild(latest, options['batch_size'])
+
+    def rebuild(self, latest, batch_size):
+        # При --rebuild снимок сделан по всем хвостам, поэтому баланс равен последнему снимку
+        balances = ClientLoyalty.objects.annotate(
+            ledger_balance=Coalesce(Subquery(latest.values('balance')[:1]), 0),
+        ).exclude(points=F('ledger_balance'))
+
+        fixed = []
+        for loyalty in balances.iterator():
+            self.stdout.write(f"client {loyalty.client_id} company {loyalty.company_id}: "
+                              f"{loyalty.points} -> {loyalty.ledger_balance}")
+            loyalty.points = loyalty.ledger_balance
+            fixed.append(loyalty)
+        ClientLoyalty.objects.bulk_update(fixed, ['points'], batch_size=batch_size)
+        bump_client_loyalty_version({loyalty.client_id for loyalty in fixed})
+
+        self.stdout.write(f"balances rebuilt: {len(fixed)}")
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_opening_snapshots(apps, schema_editor):
+    # Текущие балансы становятся начальными снимками, чтобы журнал сходился с ClientLoyalty.points
+    ClientLoyalty = apps.get_model('client_loyalty', 'ClientLoyalty')
+    PointsSnapshot = apps.get_model('client_loyalty', 'PointsSnapshot')
+    PointsSnapshot.objects.bulk_create(
+        (
+            PointsSnapshot(client_id=client_id, company_id=company_id, balance=points, last_entry_id=0)
+            for client_id, company_id, points in ClientLoyalty.objects.exclude(points=0).values_list(
+                'client_id', 'company_id', 'points').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_loyalty', '0005_alter_clientloyalty_unique_together'),
+        ('clients', '0002_remove_client_image_url'),
+        ('companies', '0004_company_description'),
+        ('transactions', '0003_alter_transaction_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsLedger',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('EARN', 'EARN'), ('SPEND', 'SPEND')], max_length=5)),
+                ('delta', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_ledger', to='clients.client')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_ledger', to='companies.company')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_ledger', to='transactions.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'company', 'id'], name='client_loya_client__cd8969_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PointsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('balance', models.BigIntegerField()),
+                ('last_entry_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_snapshots', to='clients.client')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_snapshots', to='companies.company')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'company', '-last_entry_id'], name='client_loya_client__51b5eb_idx')],
+            },
+        ),
+        migrations.RunPython(create_opening_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:41
+
+from django.db import migrations, models
+
+# Итоги по уже проведенным продажам; начисление учитывается только у продаж без списания, как в apply_points
+BACKFILL_SQL = """
+UPDATE client_loyalty_clientloyalty AS loyalty SET
+    visits_count = totals.visits_count,
+    total_spent = totals.total_spent,
+    points_earned_total = totals.points_earned_total,
+    points_used_total = totals.points_used_total,
+    first_visit_at = totals.first_visit_at,
+    last_visit_at = totals.last_visit_at
+FROM (
+    SELECT client_id, company_id,
+           COUNT(*) AS visits_count,
+           SUM(price_with_sale) AS total_spent,
+           SUM(CASE WHEN points_used = 0 THEN points_earned ELSE 0 END) AS points_earned_total,
+           SUM(points_used) AS points_used_total,
+           MIN(created_at) AS first_visit_at,
+           MAX(created_at) AS last_visit_at
+    FROM transactions_transaction
+    WHERE client_id IS NOT NULL
+    GROUP BY client_id, company_id
+) AS totals
+WHERE loyalty.client_id = totals.client_id AND loyalty.company_id = totals.company_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_loyalty', '0006_points_ledger'),
+        ('clients', '0002_remove_client_image_url'),
+        ('companies', '0005_company_daily_stats'),
+        ('transactions', '0005_transaction_stats_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientloyalty',
+            name='first_visit_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='clientloyalty',
+            name='last_visit_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='clientloyalty',
+            name='points_earned_total',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='clientloyalty',
+            name='points_used_total',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='clientloyalty',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='clientloyalty',
+            name='visits_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
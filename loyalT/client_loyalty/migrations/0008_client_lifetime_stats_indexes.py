@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся без блокировки продаж, что невозможно внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('client_loyalty', '0007_client_lifetime_stats'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='clientloyalty',
+            index=models.Index(fields=['company', '-total_spent'], name='client_loyalty_top_spent'),
+        ),
+        AddIndexConcurrently(
+            model_name='clientloyalty',
+            index=models.Index(fields=['company', '-visits_count'], name='client_loyalty_top_visits'),
+        ),
+        AddIndexConcurrently(
+            model_name='clientloyalty',
+            index=models.Index(fields=['company', '-last_visit_at'], name='client_loyalty_last_visit'),
+        ),
+    ]
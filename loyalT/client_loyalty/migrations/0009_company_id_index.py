@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('client_loyalty', '0008_client_lifetime_stats_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='clientloyalty',
+            index=models.Index(fields=['company', 'id'], name='client_loyalty_company_id'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 
 from clients.models import Client
 from companies.models import Company
+from transactions.models import Transaction
 
 
 # Create your models here.
@@ -17,6 +18,71 @@ class ClientLoyalty(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='client_loyalty')
     points = models.BigIntegerField(default=0)
     status = models.CharField(max_length=8, choices=STATUS_CHOICES, default="ACTIVE")
+    # Итоги клиента в компании, обновляются вместе с балансом при каждой продаже
+    visits_count = models.BigIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    points_earned_total = models.BigIntegerField(default=0)
+    points_used_total = models.BigIntegerField(default=0)
+    first_visit_at = models.DateTimeField(null=True, blank=True)
+    last_visit_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ("client", "company")
+        indexes = [
+            models.Index(fields=["company", "-total_spent"], name="client_loyalty_top_spent"),
+            models.Index(fields=["company", "-visits_count"], name="client_loyalty_top_visits"),
+            models.Index(fields=["company", "-last_visit_at"], name="client_loyalty_last_visit"),
+            models.Index(fields=["company", "id"], name="client_loyalty_company_id"),
+        ]
+
+    def record_visit(self, spent, points_used, points_earned, visited_at):
+        """Учитывает продажу в итогах клиента; баланс меняется отдельно."""
+        self.visits_count += 1
+        self.total_spent += spent
+        self.points_used_total += points_used
+        self.points_earned_total += points_earned
+        self.first_visit_at = self.first_visit_at or visited_at
+        self.last_visit_at = max(self.last_visit_at or visited_at, visited_at)
+
+
+class PointsLedger(models.Model):
+    KIND_CHOICES = (
+        ("EARN", "EARN"),
+        ("SPEND", "SPEND"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='points_ledger')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='points_ledger')
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='points_ledger')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    delta = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["client", "company", "id"]),
+        ]
+
+    @classmethod
+    def for_sale(cls, transaction_obj, points_used, points_earned):
+        # Правило то же, что и у баланса: при списании баллы за покупку не начисляются
+        if points_used:
+            return cls(client_id=transaction_obj.client_id, company_id=transaction_obj.company_id,
+                       transaction=transaction_obj, kind="SPEND", delta=-points_used)
+        return cls(client_id=transaction_obj.client_id, company_id=transaction_obj.company_id,
+                   transaction=transaction_obj, kind="EARN", delta=points_earned)
+
+
+class PointsSnapshot(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='points_snapshots')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='points_snapshots')
+    balance = models.BigIntegerField()
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["client", "company", "-last_entry_id"]),
+        ]
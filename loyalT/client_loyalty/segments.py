@@ -0,0 +1,211 @@
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from utils.singleflight import SingleFlight
+from .models import ClientLoyalty
+
+# Числовые атрибуты: отсортированные значения и позиции клиентов для поиска диапазона бисекцией
+NUMERIC_ATTRIBUTES = ('points', 'visits_count', 'total_spent', 'points_earned_total', 'points_used_total',
+                      'first_visit_at', 'last_visit_at')
+DATETIME_ATTRIBUTES = ('first_visit_at', 'last_visit_at')
+# Категориальные атрибуты: готовая битовая маска на каждое значение
+CATEGORY_ATTRIBUTES = ('status',)
+OPERATORS = ('eq', 'gt', 'gte', 'lt', 'lte')
+
+# Больший срок без визита не отличается от «никогда»: дальше дата выходит за пределы datetime
+MAX_DAYS_SINCE_LAST_VISIT = 36500
+
+SEGMENT_INDEX_MAX_AGE = 60
+SEGMENT_INDEX_MAX_COMPANIES = 16
+
+
+class AttributeIndex:
+    """Значения атрибута по возрастанию и соответствующие им позиции клиентов."""
+
+    def __init__(self, values):
+        positions = [position for position, value in enumerate(values) if value is not None]
+        positions.sort(key=values.__getitem__)
+        self.values = array('d', map(values.__getitem__, positions))
+        self.positions = array('l', positions)
+
+    def slice(self, op, value):
+        if op == 'eq':
+            return bisect_left(self.values, value), bisect_right(self.values, value)
+        if op == 'gt':
+            return bisect_right(self.values, value), len(self.values)
+        if op == 'gte':
+            return bisect_left(self.values, value), len(self.values)
+        if op == 'lt':
+            return 0, bisect_left(self.values, value)
+        return 0, bisect_right(self.values, value)
+
+
+class SegmentIndex:
+    """Индекс клиентов одной компании для сегментации.
+
+    Клиенты пронумерованы по возрастанию client_id, сегмент — битовая маска в int, где бит i
+    означает i-го клиента. Диапазон по числовому атрибуту находится бисекцией по отсортированному
+    массиву, а предикаты объединяются побитовыми операциями над масками.
+    """
+
+    def __init__(self, rows):
+        self.client_ids = array('q', (row['client_id'] for row in rows))
+        self.size = len(self.client_ids)
+        self.all = (1 << self.size) - 1
+        self.numeric = {
+            attribute: AttributeIndex([self._number(attribute, row[attribute]) for row in rows])
+            for attribute in NUMERIC_ATTRIBUTES
+        }
+        # Маски клиентов, у которых атрибут задан: основа для дополнения широких диапазонов
+        self.present = {attribute: self._bitmap(index.positions) for attribute, index in self.numeric.items()}
+        self.categories = {}
+        for attribute in CATEGORY_ATTRIBUTES:
+            positions = {}
+            for position, row in enumerate(rows):
+                positions.setdefault(row[attribute], []).append(position)
+            self.categories[attribute] = {value: self._bitmap(found) for value, found in positions.items()}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def for_company(cls, company_id):
+        rows = list(ClientLoyalty.objects.filter(company_id=company_id).order_by('client_id').values(
+            'client_id', *CATEGORY_ATTRIBUTES, *NUMERIC_ATTRIBUTES,
+        ).iterator(chunk_size=10000))
+        return cls(rows)
+
+    @staticmethod
+    def _number(attribute, value):
+        if value is None:
+            return None
+        if attribute in DATETIME_ATTRIBUTES:
+            return value.timestamp()
+        return float(value)
+
+    def _bitmap(self, positions):
+        bits = bytearray((self.size + 7) // 8)
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(bits, 'little')
+
+    def _range(self, attribute, op, value):
+        index = self.numeric[attribute]
+        start, end = index.slice(op, self._number(attribute, value))
+        # Широкий диапазон дешевле собрать как дополнение к узкому
+        if end - start > len(index.positions) // 2:
+            outside = self._bitmap(index.positions[:start]) | self._bitmap(index.positions[end:])
+            return self.present[attribute] & ~outside
+        return self._bitmap(index.positions[start:end])
+
+    def evaluate(self, predicate):
+        """Маска клиентов по предикату: {"and": [...]}, {"or": [...]}, {"not": {...}} или
+        {"attr": ..., "op": ..., "value": ...}."""
+        if not isinstance(predicate, dict):
+            raise ValidationError({"filter": "Predicate must be an object."})
+        if 'and' in predicate or 'or' in predicate:
+            operands = predicate.get('and', predicate.get('or'))
+            if not isinstance(operands, list) or not operands:
+                raise ValidationError({"filter": "'and'/'or' must be a non-empty list."})
+            bitmaps = [self.evaluate(operand) for operand in operands]
+            result = bitmaps[0]
+            for bitmap in bitmaps[1:]:
+                result = result & bitmap if 'and' in predicate else result | bitmap
+            return result
+        if 'not' in predicate:
+            return self.all & ~self.evaluate(predicate['not'])
+        return self._leaf(predicate.get('attr'), predicate.get('op'), predicate.get('value'))
+
+    def _leaf(self, attribute, op, value):
+        if op not in OPERATORS:
+            raise ValidationError({"filter": f"Unknown op {op!r}, expected one of {', '.join(OPERATORS)}."})
+        if attribute in CATEGORY_ATTRIBUTES:
+            if op != 'eq':
+                raise ValidationError({"filter": f"Only 'eq' is supported for {attribute}."})
+            return self.categories[attribute].get(value, 0)
+        if attribute == 'days_since_last_visit':
+            if op == 'eq':
+                raise ValidationError({"filter": "Only gt, gte, lt and lte are supported for days_since_last_visit."})
+            # Больше N дней без визита — последний визит раньше, чем N дней назад
+            days = self._float(value)
+            if not 0 <= days <= MAX_DAYS_SINCE_LAST_VISIT:
+                raise ValidationError(
+                    {"filter": f"days_since_last_visit must be between 0 and {MAX_DAYS_SINCE_LAST_VISIT}."})
+            mirrored = {'gt': 'lt', 'gte': 'lte', 'lt': 'gt', 'lte': 'gte'}[op]
+            return self._range('last_visit_at', mirrored, timezone.now() - timedelta(days=days))
+        if attribute not in self.numeric:
+            raise ValidationError({"filter": f"Unknown attribute {attribute!r}."})
+        if attribute in DATETIME_ATTRIBUTES:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValidationError({"filter": f"{attribute} must be an ISO 8601 datetime."})
+            return self._range(attribute, op, value if timezone.is_aware(value) else timezone.make_aware(value))
+        return self._range(attribute, op, self._float(value))
+
+    @staticmethod
+    def _float(value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError({"filter": f"Value {value!r} must be a number."})
+        if not math.isfinite(number):
+            raise ValidationError({"filter": f"Value {value!r} must be a finite number."})
+        return number
+
+    def page(self, bitmap, offset, limit):
+        """client_id клиентов сегмента по возрастанию, начиная с offset-го."""
+        data = bitmap.to_bytes((self.size + 7) // 8 or 1, 'little')
+        client_ids = []
+        for word_start in range(0, len(data), 8):
+            word = int.from_bytes(data[word_start:word_start + 8], 'little')
+            count = word.bit_count()
+            # Целые слова до нужного смещения пропускаются по popcount
+            if offset >= count:
+                offset -= count
+                continue
+            while word and len(client_ids) < limit:
+                low = word & -word
+                if offset:
+                    offset -= 1
+                else:
+                    client_ids.append(self.client_ids[word_start * 8 + low.bit_length() - 1])
+                word ^= low
+            if len(client_ids) == limit:
+                break
+        return client_ids
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_builds = SingleFlight()
+
+
+def get_segment_index(company_id):
+    """Индекс компании из памяти воркера; пересобирается, если старше SEGMENT_INDEX_MAX_AGE секунд."""
+    def fresh():
+        with _indexes_lock:
+            index = _indexes.get(company_id)
+            if index is not None and time.monotonic() - index.built_at < SEGMENT_INDEX_MAX_AGE:
+                _indexes.move_to_end(company_id)
+                return index
+        return None
+
+    index = fresh()
+    if index is not None:
+        return index
+    with _builds.lock(company_id):
+        index = fresh()
+        if index is None:
+            index = SegmentIndex.for_company(company_id)
+            with _indexes_lock:
+                _indexes[company_id] = index
+                while len(_indexes) > SEGMENT_INDEX_MAX_COMPANIES:
+                    _indexes.popitem(last=False)
+    return index
@@ -31,6 +31,14 @@ class CompanyLoyaltySerializer(serializers.Serializer):
         return None
 
 
+class BulkSubscribeSerializer(serializers.Serializer):
+    company_ids = serializers.ListField(child=serializers.UUIDField(), min_length=1, max_length=100)
+
+
+class SwaggerBulkSubscribeResponse(serializers.Serializer):
+    subscribed = serializers.ListField(child=serializers.UUIDField())
+
+
 class SwaggerClientLoyaltyAPI(serializers.Serializer):
     id = serializers.IntegerField()
     company_id = serializers.UUIDField()
@@ -0,0 +1,102 @@
+from django.db import connection
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from clients.models import Client
+from companies.models import Company
+
+from .cache import bump_client_loyalty_version
+from .exceptions import InsufficientPoints
+from .models import ClientLoyalty, PointsLedger, PointsSnapshot
+
+
+def apply_points(client_id, company_id, points_used, points_earned, spent, visited_at):
+    """Атомарно меняет баланс и итоги клиента одним условным UPDATE.
+
+    Списание и начисление выполняются в базе, поэтому параллельные продажи не теряют
+    обновления, а условие ``points >= points_used`` не допускает отрицательного баланса.
+    Если у клиента еще нет баланса в компании, он заводится при первом начислении.
+    """
+    delta = points_earned if points_used == 0 else -points_used
+    balances = ClientLoyalty.objects.filter(client_id=client_id, company_id=company_id)
+    updates = {
+        'points': F('points') + delta,
+        'visits_count': F('visits_count') + 1,
+        'total_spent': F('total_spent') + spent,
+        'points_used_total': F('points_used_total') + points_used,
+        'points_earned_total': F('points_earned_total') + max(delta, 0),
+        'first_visit_at': Coalesce(F('first_visit_at'), Value(visited_at)),
+        'last_visit_at': Greatest(F('last_visit_at'), Value(visited_at)),
+    }
+
+    if not balances.filter(points__gte=points_used).update(**updates):
+        if points_used:
+            raise InsufficientPoints()
+
+        ClientLoyalty.objects.bulk_create([ClientLoyalty(client_id=client_id, company_id=company_id)],
+                                          ignore_conflicts=True)
+        balances.update(**updates)
+    bump_client_loyalty_version([client_id])
+
+
+def subscribe(client_id, company_ids):
+    """Подписывает клиента на компании одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Возвращает id компаний, где подписка появилась или снова стала активной; уже активные
+    подписки и несуществующие компании в ответ не попадают. Строки вставляются в порядке id
+    компаний, чтобы параллельные запросы не ловили deadlock.
+    """
+    if not company_ids:
+        return []
+
+    meta = ClientLoyalty._meta
+    table = connection.ops.quote_name(meta.db_table)
+    # Значения по умолчанию заданы в Django, а не в схеме, поэтому передаются явно
+    defaults = [
+        (field.column, field.get_default())
+        for field in meta.concrete_fields
+        if field.has_default() and field.name != 'status'
+    ]
+    columns = ['client_id', 'company_id', 'status', *(column for column, _ in defaults)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT client.id, company.id, 'ACTIVE', {', '.join(['%s'] * len(defaults))} "
+            f"FROM {connection.ops.quote_name(Company._meta.db_table)} company "
+            f"JOIN {connection.ops.quote_name(Client._meta.db_table)} client ON client.id = %s "
+            f"WHERE company.id = ANY(%s::uuid[]) ORDER BY company.id "
+            f"ON CONFLICT (client_id, company_id) DO UPDATE SET status = 'ACTIVE' "
+            f"WHERE {table}.status <> 'ACTIVE' "
+            f"RETURNING company_id",
+            [*(value for _, value in defaults), client_id, [str(company_id) for company_id in company_ids]],
+        )
+        subscribed = [row[0] for row in cursor.fetchall()]
+    if subscribed:
+        bump_client_loyalty_version([client_id])
+    return subscribed
+
+
+def unsubscribe(client_id, company_id):
+    """Деактивирует подписку условным UPDATE; True, если она была активной."""
+    if not ClientLoyalty.objects.filter(client_id=client_id, company_id=company_id, status='ACTIVE').update(
+            status='INACTIVE'):
+        return False
+    bump_client_loyalty_version([client_id])
+    return True
+
+
+def ledger_balance(client_id, company_id):
+    """Баланс по журналу: последний снимок плюс хвост операций после него."""
+    snapshot = PointsSnapshot.objects.filter(
+        client_id=client_id,
+        company_id=company_id,
+    ).order_by('-last_entry_id').values('balance', 'last_entry_id').first()
+    snapshot = snapshot or {'balance': 0, 'last_entry_id': 0}
+
+    tail = PointsLedger.objects.filter(
+        client_id=client_id,
+        company_id=company_id,
+        id__gt=snapshot['last_entry_id'],
+    ).aggregate(total=Sum('delta'))['total']
+
+    return snapshot['balance'] + (tail or 0)
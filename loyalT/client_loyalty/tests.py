@@ -1,3 +1,272 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from cashiers.models import Cashier
+from clients.models import Client
+from companies.models import Company
+from transactions.models import Transaction
+from users.auth.tokens import LoyalTSlidingToken
+from .models import ClientLoyalty, PointsLedger, PointsSnapshot
+from .segments import SegmentIndex
+from .services import ledger_balance
+
+User = get_user_model()
+
+
+
+class PointsLedgerTests(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        self.cashier = Cashier.objects.create(user=User.objects.create(), company=self.company, username="cashier")
+        self.client_obj = Client.objects.create(id=1, first_name="Иван")
+        self.loyalty = ClientLoyalty.objects.create(client=self.client_obj, company=self.company)
+
+    def add_sale(self, points_used, points_earned):
+        transaction_obj = Transaction.objects.create(
+            client=self.client_obj, company=self.company, cashier=self.cashier, price=100, price_with_sale=100,
+            points_used=points_used, points_earned=points_earned,
+        )
+        PointsLedger.for_sale(transaction_obj, points_used, points_earned).save()
+
+    def test_ledger_balance_with_snapshots(self):
+        self.add_sale(0, 20)
+        self.add_sale(0, 20)
+        self.assertEqual(ledger_balance(self.client_obj.id, self.company.id), 40)
+
+        call_command('snapshot_points_ledger', stdout=StringIO())
+        self.assertEqual(PointsSnapshot.objects.get().balance, 40)
+
+        self.add_sale(15, 20)
+        self.assertEqual(ledger_balance(self.client_obj.id, self.company.id), 25)
+
+        call_command('snapshot_points_ledger', stdout=StringIO())
+        snapshot = PointsSnapshot.objects.get()
+        self.assertEqual(snapshot.balance, 25)
+        self.assertEqual(snapshot.last_entry_id, PointsLedger.objects.latest('id').id)
+
+    def test_rebuild_balances(self):
+        self.add_sale(0, 30)
+        self.add_sale(10, 5)
+
+        call_command('snapshot_points_ledger', rebuild=True, stdout=StringIO())
+        self.loyalty.refresh_from_db()
+        self.assertEqual(self.loyalty.points, 20)
+
+
+class SegmentIndexTests(SimpleTestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.rows = [
+            {
+                'client_id': client_id, 'status': 'ACTIVE' if client_id % 10 else 'INACTIVE',
+                'points': client_id % 50, 'visits_count': client_id % 7, 'total_spent': client_id * 10,
+                'points_earned_total': 0, 'points_used_total': 0,
+                'first_visit_at': now - timedelta(days=client_id % 90) if client_id % 7 else None,
+                'last_visit_at': now - timedelta(days=client_id % 60) if client_id % 7 else None,
+            }
+            for client_id in range(1, 2001)
+        ]
+        self.index = SegmentIndex(self.rows)
+
+    def expected(self, condition):
+        return [row['client_id'] for row in self.rows if condition(row)]
+
+    def test_combined_predicates_match_linear_scan(self):
+        now = timezone.now()
+        segment = self.index.evaluate({"and": [
+            {"attr": "total_spent", "op": "gt", "value": 5000},
+            {"attr": "days_since_last_visit", "op": "gte", "value": 30},
+            {"not": {"attr": "status", "op": "eq", "value": "INACTIVE"}},
+        ]})
+        expected = self.expected(lambda row: row['total_spent'] > 5000 and row['last_visit_at'] is not None
+                                 and row['last_visit_at'] <= now - timedelta(days=30) and row['status'] == 'ACTIVE')
+        self.assertEqual(segment.bit_count(), len(expected))
+        self.assertEqual(self.index.page(segment, 0, 10000), expected)
+        self.assertEqual(self.index.page(segment, 100, 25), expected[100:125])
+
+        segment = self.index.evaluate({"or": [
+            {"attr": "visits_count", "op": "eq", "value": 3},
+            {"attr": "points", "op": "lt", "value": 40},
+        ]})
+        self.assertEqual(self.index.page(segment, 0, 10000),
+                         self.expected(lambda row: row['visits_count'] == 3 or row['points'] < 40))
+
+    def test_invalid_predicate(self):
+        for predicate in ({"attr": "name", "op": "eq", "value": 1}, {"attr": "points", "op": "like", "value": 1},
+                          {"and": []}, {"attr": "points", "op": "gt", "value": "many"},
+                          {"attr": "points", "op": "gt", "value": "nan"},
+                          {"attr": "total_spent", "op": "lt", "value": "inf"},
+                          {"attr": "days_since_last_visit", "op": "gt", "value": 1e6},
+                          {"attr": "days_since_last_visit", "op": "gt", "value": 1e9},
+                          {"attr": "days_since_last_visit", "op": "gt", "value": "nan"},
+                          {"attr": "days_since_last_visit", "op": "gt", "value": -1}):
+            with self.assertRaises(ValidationError):
+                self.index.evaluate(predicate)
+
+
+class ClientSegmentViewTests(APITestCase):
+    def test_segment_counts_and_pages(self):
+        company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        for client_id in range(1, 6):
+            client = Client.objects.create(id=client_id, first_name=f"Клиент {client_id}")
+            ClientLoyalty.objects.create(client=client, company=company, total_spent=client_id * 1000,
+                                         visits_count=1, last_visit_at=timezone.now() - timedelta(days=40))
+        token = str(LoyalTSlidingToken.for_user(company.user))
+
+        response = self.client.post('/api/client/segments/', {
+            "filter": {"and": [{"attr": "total_spent", "op": "gte", "value": 2000},
+                               {"attr": "days_since_last_visit", "op": "gt", "value": 30}]},
+            "offset": 1, "limit": 2,
+        }, headers={"Authorization": "Bearer " + token}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 4)
+        self.assertEqual([row["client_id"] for row in response.json()["results"]], [3, 4])
+
+        response = self.client.post('/api/client/segments/', {"filter": {"attr": "x", "op": "eq", "value": 1}},
+                                    headers={"Authorization": "Bearer " + token}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class CompanyCatalogTests(APITestCase):
+    def test_subscribed_first_keyset_with_cursor(self):
+        companies = [
+            Company.objects.create(user=User.objects.create(), name=f"Компания {i}", username=f"company{i}")
+            for i in range(5)
+        ]
+        client = Client.objects.create(id=1, first_name="Иван")
+        ClientLoyalty.objects.create(client=client, company=companies[3], points=70)
+        ClientLoyalty.objects.create(client=client, company=companies[1], points=5, status="INACTIVE")
+        url = '/api/client/1/company'
+
+        # Клиент, его строки лояльности, подписки и остальные компании
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        catalog = response.json()
+        self.assertEqual(len(catalog), 5)
+        self.assertEqual(catalog[0]["company"]["id"], str(companies[3].id))
+        self.assertEqual(catalog[0]["loyalty"], {"points": 70, "is_subscribed": True})
+        inactive = next(row for row in catalog if row["company"]["id"] == str(companies[1].id))
+        self.assertEqual(inactive["loyalty"], {"points": 5, "is_subscribed": False})
+
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+            page = self.client.get(url, params).json()
+            pages.extend(page["results"])
+            cursor = page["next"]
+            if not cursor:
+                break
+        self.assertEqual(pages, catalog)
+
+        response = self.client.get(url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ClientLoyaltyViewSetTests(APITestCase):
+    def test_scoped_to_company_with_cursor_pages(self):
+        company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        other = Company.objects.create(user=User.objects.create(), name="Пекарня", username="bakery")
+        for client_id in range(1, 6):
+            client = Client.objects.create(id=client_id, first_name=f"Клиент {client_id}")
+            ClientLoyalty.objects.create(client=client, company=company, points=client_id)
+            ClientLoyalty.objects.create(client=client, company=other)
+        headers = {"Authorization": "Bearer " + str(LoyalTSlidingToken.for_user(company.user))}
+        self.client.get('/api/client/loyalty/', headers=headers)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/client/loyalty/', {"limit": 2}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.json())
+        self.assertEqual([row["points"] for row in response.json()["results"]], [1, 2])
+        self.assertEqual(response.json()["results"][0]["company_name"], "Кофейня")
+
+        points = []
+        url = response.json()["next"]
+        while url:
+            page = self.client.get(url, headers=headers).json()
+            points += [row["points"] for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(points, [3, 4, 5])
+
+        foreign = ClientLoyalty.objects.get(company=other, client_id=1)
+        self.assertEqual(self.client.get(f'/api/client/loyalty/{foreign.id}/', headers=headers).status_code, 404)
+        self.assertEqual(self.client.get('/api/client/loyalty/').status_code, 401)
+
+
+class SubscriptionTests(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        self.client_obj = Client.objects.create(id=1, first_name="Иван")
+        self.url = f'/api/client/1/company/{self.company.id}/'
+
+    def test_subscribe_and_unsubscribe_in_one_statement(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.post(self.url + 'subscribe/').status_code, 201)
+        self.assertEqual(self.client.post(self.url + 'subscribe/').status_code, 400)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.delete(self.url + 'unsubscribe/').status_code, 200)
+        self.assertEqual(self.client.delete(self.url + 'unsubscribe/').status_code, 400)
+
+        self.assertEqual(self.client.post(self.url + 'subscribe/').status_code, 201)
+        loyalty = ClientLoyalty.objects.get(client=self.client_obj, company=self.company)
+        self.assertEqual((loyalty.status, loyalty.points, loyalty.visits_count), ("ACTIVE", 0, 0))
+
+        self.assertEqual(self.client.post(f'/api/client/2/company/{self.company.id}/subscribe/').status_code, 404)
+
+    def test_bulk_subscribe(self):
+        other = Company.objects.create(user=User.objects.create(), name="Пекарня", username="bakery")
+        self.client.post(self.url + 'subscribe/')
+
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/client/1/company/subscribe/', {
+                "company_ids": [str(self.company.id), str(other.id), "00000000-0000-0000-0000-000000000000"],
+            }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["subscribed"], [str(other.id)])
+        self.assertEqual(ClientLoyalty.objects.filter(client=self.client_obj, status="ACTIVE").count(), 2)
+
+        response = self.client.post('/api/client/2/company/subscribe/', {"company_ids": [str(other.id)]},
+                                    format="json")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/api/client/1/company/subscribe/', {"company_ids": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(APITestCase):
+    def test_not_modified_until_loyalty_or_catalog_changes(self):
+        company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        Client.objects.create(id=1, first_name="Иван")
+
+        for url in ('/api/client/1/', '/api/client/1/company'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(url, headers={"If-Modified-Since": response.headers["Last-Modified"]})
+            self.assertEqual(response.status_code, 304)
+
+        etag = self.client.get('/api/client/1/').headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/client/1/company/{company.id}/subscribe/')
+        response = self.client.get('/api/client/1/', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+        etag = response.headers["ETag"]
+        token = str(LoyalTSlidingToken.for_user(company.user))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/company/{company.id}/', {"name": "Кофейня 2"},
+                              headers={"Authorization": "Bearer " + token}, format="json")
+        response = self.client.get('/api/client/1/', headers={"If-None-Match": etag})
+        self.assertEqual(response.json()[0]["company_name"], "Кофейня 2")
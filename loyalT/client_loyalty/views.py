@@ -1,6 +1,10 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework import mixins
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.viewsets import GenericViewSet
@@ -8,11 +12,29 @@ from rest_framework.viewsets import GenericViewSet
 from cashiers.serializers import SwaggerCashierSaleSerializer
 from clients.models import Client
 from companies.models import Company
+from companies.permissions import IsUserCompany
 from companies.serializers import CompanySerializer
 from rest_framework import status as rest_status
 from rest_framework.response import Response
 from .models import ClientLoyalty
-from .serializers import ClientLoyaltySerializer, CompanyLoyaltySerializer, SwaggerCompanyJoinLoyaltyAPI
+from .serializers import ClientLoyaltySerializer, CompanyLoyaltySerializer, SwaggerCompanyJoinLoyaltyAPI, \
+    BulkSubscribeSerializer, SwaggerBulkSubscribeResponse
+from .cache import client_loyalty_version_keys
+from .services import subscribe, unsubscribe
+from utils.cursors import decode_cursor, encode_cursor
+from utils.versions import conditional
+
+COMPANY_CATALOG_PAGE_SIZE = 20
+COMPANY_CATALOG_MAX_PAGE_SIZE = 100
+# Поля компании, которые отдает CompanySerializer в каталоге
+CATALOG_COMPANY_FIELDS = ('id', 'username', 'name', 'max_sale', 'bonus_points_ratio', 'description')
+
+
+class ClientLoyaltyCursorPagination(CursorPagination):
+    # Keyset по индексу (company, id): глубокие страницы стоят столько же, сколько первая, без COUNT(*)
+    ordering = 'id'
+    page_size_query_param = 'limit'
+    max_page_size = 100
 
 
 class ClientLoyaltyAPI(APIView):
@@ -32,6 +54,7 @@ class ClientLoyaltyAPI(APIView):
             )
         }
     )
+    @conditional(client_loyalty_version_keys)
     def get(self, request, client_id):
         client = get_object_or_404(Client, id=client_id)
         company_id = request.GET.get('company_id')
@@ -51,7 +74,15 @@ class CompanyJoinLoyaltyAPI(APIView):
         tags=["Client"],
         operation_id="list_companies_with_loyalty_status",
         operation_summary="Список всех компаний со статусом подписки",
-        operation_description="Получение полного списка компаний с информацией о подписке и баллах лояльности клиента",
+        operation_description="Получение списка компаний с информацией о подписке и баллах лояльности клиента. "
+                              "Компании с подпиской идут первыми. С параметром limit или cursor ответ "
+                              "постраничный: {\"next\": cursor, \"results\": [...]}.",
+        manual_parameters=[
+            openapi.Parameter(name='limit', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description="Размер страницы, не больше 100"),
+            openapi.Parameter(name='cursor', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Значение next из предыдущей страницы"),
+        ],
         responses={
             200: openapi.Response(
                 description="Успешный запрос",
@@ -64,26 +95,73 @@ class CompanyJoinLoyaltyAPI(APIView):
             )
         }
     )
+    @conditional(client_loyalty_version_keys)
     def get(self, request, client_id):
         client = get_object_or_404(Client, id=client_id)
 
-        companies = Company.objects.all()
-
-        loyalty_datas = {
-            company.id: {"company": CompanySerializer(company).data} \
-                        | {"loyalty":
-                               {'points': 0, 'is_subscribed': False}
-                           } for company in companies
+        # Сначала строки лояльности клиента, затем компании двумя keyset-выборками по индексу (name, id):
+        # подписки и остальные, без сортировки всего каталога
+        loyalties = {
+            company_id: (loyalty_id, points, status)
+            for company_id, loyalty_id, points, status in ClientLoyalty.objects.filter(client=client).values_list(
+                'company_id', 'id', 'points', 'status',
+            )
         }
-        client_loyalty_companies = ClientLoyalty.objects.filter(client=client)
+        subscribed = [company_id for company_id, (_, _, status) in loyalties.items() if status == 'ACTIVE']
+        sections = [(1, Company.objects.exclude(id__in=subscribed))]
+        if subscribed:
+            sections.insert(0, (0, Company.objects.filter(id__in=subscribed)))
 
-        for client_loyalty in client_loyalty_companies:
-            loyalty_datas[client_loyalty.company.id].update({"loyalty_id": client_loyalty.id})
-            loyalty_datas[client_loyalty.company.id]["loyalty"]["points"] = client_loyalty.points
-            loyalty_datas[client_loyalty.company.id]["loyalty"]["is_subscribed"] = client_loyalty.status == 'ACTIVE'
+        limit = request.query_params.get('limit')
+        cursor = request.query_params.get('cursor')
+        if limit is None and cursor is None:
+            return Response([
+                self.company_loyalty(company, rank, loyalties)
+                for rank, companies in sections
+                for company in self.catalog(companies)
+            ], status=rest_status.HTTP_200_OK)
 
-        response = list(loyalty_datas.values())
-        return Response(response, status=rest_status.HTTP_200_OK)
+        try:
+            limit = min(int(limit or COMPANY_CATALOG_PAGE_SIZE), COMPANY_CATALOG_MAX_PAGE_SIZE)
+            rank, name, company_id = decode_cursor(cursor) if cursor else (0, None, None)
+            if limit < 1:
+                raise ValueError
+            page = []
+            for section_rank, companies in sections:
+                if section_rank < rank:
+                    continue
+                companies = self.catalog(companies)
+                if section_rank == rank and name is not None:
+                    companies = companies.filter(Q(name__gt=name) | Q(name=name, id__gt=company_id))
+                page += [(section_rank, company) for company in companies[:limit + 1 - len(page)]]
+                if len(page) > limit:
+                    break
+        except (TypeError, ValueError, DjangoValidationError):
+            return Response({"detail": "Invalid cursor or limit"}, status=rest_status.HTTP_400_BAD_REQUEST)
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last_rank, last = page[-1]
+            next_cursor = encode_cursor([last_rank, last.name, str(last.id)])
+
+        return Response({
+            "next": next_cursor,
+            "results": [self.company_loyalty(company, rank, loyalties) for rank, company in page],
+        }, status=rest_status.HTTP_200_OK)
+
+    @staticmethod
+    def catalog(companies):
+        return companies.only(*CATALOG_COMPANY_FIELDS).order_by('name', 'id')
+
+    @staticmethod
+    def company_loyalty(company, rank, loyalties):
+        loyalty_id, points, status = loyalties.get(company.id, (None, 0, None))
+        return {
+            "company": CompanySerializer(company).data,
+            "loyalty": {"points": points, "is_subscribed": rank == 0},
+            "loyalty_id": loyalty_id,
+        }
 
 
 class SubscribeToCompanyAPI(APIView):
@@ -114,22 +192,15 @@ class SubscribeToCompanyAPI(APIView):
         }
     )
     def post(self, request, client_id, company_id, *args, **kwargs):
-        client = get_object_or_404(Client, id=client_id)
-        company = get_object_or_404(Company, id=company_id)
-
-        client_loyalty = ClientLoyalty.objects.filter(client=client, company=company)
-        if client_loyalty.exists() and client_loyalty.first().status == 'ACTIVE':
+        if not subscribe(client_id, [company_id]):
+            # Ничего не изменилось: выясняем причину только на этом редком пути
+            get_object_or_404(Client, id=client_id)
+            get_object_or_404(Company, id=company_id)
             return Response(
                 {'detail': 'Вы уже подписаны на эту компанию.'},
                 status=rest_status.HTTP_400_BAD_REQUEST
             )
 
-        ClientLoyalty.objects.update_or_create(
-            client=client,
-            company=company,
-            defaults={'status': 'ACTIVE'}
-        )
-
         return Response(
             {'detail': 'Вы успешно подписались на компанию.'},
             status=rest_status.HTTP_201_CREATED
@@ -164,31 +235,51 @@ class UnsubscribeFromCompanyAPI(APIView):
         }
     )
     def delete(self, request, client_id, company_id, *args, **kwargs):
-        client = get_object_or_404(Client, id=client_id)
-        company = get_object_or_404(Company, id=company_id)
-
-        try:
-            client_loyalty = ClientLoyalty.objects.get(client=client, company=company)
-            if client_loyalty.status == 'INACTIVE':
-                return Response(
-                    {'detail': 'Вы не подписаны на эту компанию.'},
-                    status=rest_status.HTTP_400_BAD_REQUEST
-                )
-        except ClientLoyalty.DoesNotExist:
+        if not unsubscribe(client_id, company_id):
+            get_object_or_404(Client, id=client_id)
+            get_object_or_404(Company, id=company_id)
             return Response(
                 {'detail': 'Вы не подписаны на эту компанию.'},
                 status=rest_status.HTTP_400_BAD_REQUEST
             )
 
-        client_loyalty.status = 'INACTIVE'
-        client_loyalty.save()
-
         return Response(
             {'detail': 'Вы успешно отписались от компании.'},
             status=rest_status.HTTP_200_OK
         )
 
 
+class BulkSubscribeAPI(APIView):
+    @swagger_auto_schema(
+        tags=["Client"],
+        operation_id="bulk_subscribe_to_companies",
+        operation_summary="Подписка на несколько компаний",
+        operation_description="Активация программы лояльности клиента сразу в нескольких компаниях одним запросом. "
+                              "В ответе — компании, где подписка появилась или снова стала активной; "
+                              "уже активные подписки и несуществующие компании пропускаются.",
+        request_body=BulkSubscribeSerializer,
+        responses={
+            200: SwaggerBulkSubscribeResponse,
+            400: "Неверные данные",
+            404: openapi.Response(
+                description="Клиент не найден",
+                examples={
+                    "application/json": {"detail": "Not found."}
+                }
+            )
+        }
+    )
+    def post(self, request, client_id, *args, **kwargs):
+        serializer = BulkSubscribeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"detail": serializer.errors}, status=rest_status.HTTP_400_BAD_REQUEST)
+
+        subscribed = subscribe(client_id, serializer.validated_data['company_ids'])
+        if not subscribed:
+            get_object_or_404(Client, id=client_id)
+        return Response({"subscribed": subscribed}, status=rest_status.HTTP_200_OK)
+
+
 class ClientLoyaltyViewSet(
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -196,8 +287,29 @@ class ClientLoyaltyViewSet(
 ):
     alowed_methods = ('get')
     serializer_class = ClientLoyaltySerializer
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+    pagination_class = ClientLoyaltyCursorPagination
+
+    queryset = ClientLoyalty.objects.select_related('company').only(
+        'id', 'points', 'status', 'company__id', 'company__name',
+    )
+
+    def get_queryset(self):
+        return self.queryset.filter(company_id=self.request.user.company_id)
 
-    queryset = ClientLoyalty.objects.all()
+    @swagger_auto_schema(
+        tags=["Client"],
+        operation_id="list_client_loyalty",
+        operation_summary="Список клиентов программы лояльности компании",
+        operation_description="Балансы и статусы клиентов компании текущего пользователя. "
+                              "Пагинация курсором: параметр limit задает размер страницы, "
+                              "ссылки next/previous ведут на соседние страницы.",
+        responses={
+            200: serializer_class(many=True),
+        }
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     @swagger_auto_schema(
         tags=["Client"],
@@ -20,6 +20,37 @@ class ClientSerializer(serializers.ModelSerializer):
 class SwaggerClientStatsLoyalView(serializers.Serializer):
     from_date = serializers.DateField()
     to_date = serializers.DateField()
+    granularity = serializers.ChoiceField(choices=("day", "week", "month"), default="day",
+                                          help_text="date в ответе — первый день периода")
+
+
+class SwaggerClientTopViewResponse(serializers.Serializer):
+    client_id = serializers.IntegerField()
+    first_name = serializers.CharField()
+    points = serializers.IntegerField()
+    visits_count = serializers.IntegerField()
+    total_spent = serializers.DecimalField(decimal_places=2, max_digits=14)
+    points_earned_total = serializers.IntegerField()
+    points_used_total = serializers.IntegerField()
+    first_visit_at = serializers.DateTimeField()
+    last_visit_at = serializers.DateTimeField()
+
+
+class SwaggerClientSegmentView(serializers.Serializer):
+    filter = serializers.JSONField(help_text='Предикат: {"and": [...]}, {"or": [...]}, {"not": {...}} или '
+                                             '{"attr": "total_spent", "op": "gt", "value": 5000}. Атрибуты: '
+                                             'points, visits_count, total_spent, points_earned_total, '
+                                             'points_used_total, first_visit_at, last_visit_at, '
+                                             'days_since_last_visit, status')
+    offset = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+
+class SwaggerClientSegmentViewResponse(serializers.Serializer):
+    count = serializers.IntegerField()
+    offset = serializers.IntegerField()
+    limit = serializers.IntegerField()
+    results = SwaggerClientTopViewResponse(many=True)
 
 
 class SwaggerClientStatsLoyalViewResponse(serializers.Serializer):
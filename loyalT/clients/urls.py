@@ -1,8 +1,10 @@
 from django.urls import path
 
-from .views import ClientAPI, ClientStatsLoyalView
+from .views import ClientAPI, ClientStatsLoyalView, ClientTopView, ClientSegmentView
 
 urlpatterns = [
     path('register/', ClientAPI.as_view(), name='client-register'),
-    path('stats/amount/', ClientStatsLoyalView.as_view(), name='client-stats-amount')
+    path('stats/amount/', ClientStatsLoyalView.as_view(), name='client-stats-amount'),
+    path('stats/top/', ClientTopView.as_view(), name='client-stats-top'),
+    path('segments/', ClientSegmentView.as_view(), name='client-segments'),
 ]
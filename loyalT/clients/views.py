@@ -1,15 +1,37 @@
-from django.db.models import Count, Sum, Q
-from django.db.models.functions import TruncDate
+from datetime import date, datetime
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.mixins import CreateModelMixin
 from rest_framework.generics import GenericAPIView
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema  # Импорт декоратора
 from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 
 from clients.models import Client
-from clients.serializers import ClientSerializer, SwaggerClientStatsLoyalView, SwaggerClientStatsLoyalViewResponse
-from transactions.models import Transaction
+from companies.cache import cached_stats, merge_rows
+from companies.models import CompanyDailyStats
+from companies.permissions import IsUserCompany
+from clients.serializers import ClientSerializer, SwaggerClientStatsLoyalView, SwaggerClientStatsLoyalViewResponse, \
+    SwaggerClientTopViewResponse, SwaggerClientSegmentView, SwaggerClientSegmentViewResponse
+from client_loyalty.models import ClientLoyalty
+from client_loyalty.segments import get_segment_index
+
+
+STATS_GRANULARITY = {
+    'day': F,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+CLIENT_STATS_FIELDS = ('client_id', 'points', 'visits_count', 'total_spent', 'points_earned_total',
+                       'points_used_total', 'first_visit_at', 'last_visit_at')
+# Сортировки топа клиентов, у каждой свой индекс (company, -поле) в ClientLoyalty
+TOP_CLIENTS_ORDERING = ('total_spent', 'visits_count', 'last_visit_at')
 
 
 class ClientAPI(CreateModelMixin, GenericAPIView):
@@ -40,11 +62,14 @@ class ClientAPI(CreateModelMixin, GenericAPIView):
 
 
 class ClientStatsLoyalView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
     @swagger_auto_schema(
         tags=["Client"],
         operation_summary="Статистика по клиентам",
         operation_id="client_stats",
-        operation_description="Получение статистики по клиентам",
+        operation_description="Получение статистики по клиентам. Итоги и ряд по дням, неделям или месяцам "
+                              "(granularity) считаются одним запросом.",
         request_body=SwaggerClientStatsLoyalView,
         responses={
             200: SwaggerClientStatsLoyalViewResponse(),
@@ -56,37 +81,137 @@ class ClientStatsLoyalView(APIView):
         if not from_date or not to_date:
             return Response({"error": "Both from_date and to_date are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        company_id = request.user.company.id
-        transactions = Transaction.objects.filter(
-            company_id=company_id,
-            created_at__range=[from_date, to_date]
-        ).annotate(day=TruncDate('created_at'))
+        try:
+            from_date, to_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+        except ValueError:
+            return Response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
 
-        transactions_count = transactions.count()
-        transactions_without_loyalty_count = transactions.filter(client_id__isnull=True).count()
+        granularity = request.data.get('granularity', 'day')
+        if granularity not in STATS_GRANULARITY:
+            return Response({"error": "granularity must be one of: day, week, month."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        daily_stats = transactions.values('day').annotate(
-            transactions_count=Count('id'),
-            loyal=Count('id', filter=Q(client_id__isnull=False)),
-            no_loyal=Count('id', filter=Q(client_id__isnull=True))
-        ).order_by('-day')
+        company_id = request.user.company_id
+        daily_stats = cached_stats(
+            company_id, 'client_loyal', granularity, from_date, to_date,
+            lambda from_day, to_day: list(CompanyDailyStats.objects.filter(
+                company_id=company_id,
+                day__range=[from_day, to_day]
+            ).values(
+                period=STATS_GRANULARITY[granularity]('day'),
+            ).annotate(
+                transactions_count=Sum('transactions_count'),
+                loyal_count=Sum('loyal_count'),
+                no_loyal_count=Sum('no_loyal_count'),
+            ).order_by('-period')),
+            # Неделя или месяц с сегодняшним днем приходит в обоих срезах и складывается
+            merge_rows(('period',), ('transactions_count', 'loyal_count', 'no_loyal_count')),
+        )
 
         response = {
             str(company_id): {
                 'company_id': str(company_id),
-                'all_transactions_count': transactions_count,
-                'all_loyal': transactions_count - transactions_without_loyalty_count,
-                'all_no_loyal': transactions_without_loyalty_count,
+                'all_transactions_count': sum(stat['transactions_count'] for stat in daily_stats),
+                'all_loyal': sum(stat['loyal_count'] for stat in daily_stats),
+                'all_no_loyal': sum(stat['no_loyal_count'] for stat in daily_stats),
                 'result': []
             }
         }
 
         for stat in daily_stats:
             response[str(company_id)]['result'].append({
-                'date': stat['day'],
+                'date': stat['period'],
                 'transactions_count': stat['transactions_count'],
-                'loyal': stat['loyal'],
-                'no_loyal': stat['no_loyal']
+                'loyal': stat['loyal_count'],
+                'no_loyal': stat['no_loyal_count']
             })
 
         return Response(list(response.values()), status=status.HTTP_200_OK)
+
+
+class ClientTopView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
+    @swagger_auto_schema(
+        tags=["Client"],
+        operation_summary="Лучшие клиенты компании",
+        operation_id="client_top",
+        operation_description="Клиенты с покупками в компании, отсортированные по сумме покупок, числу визитов "
+                              "или последнему визиту. last_visit_before оставляет клиентов, не приходивших "
+                              "с указанной даты.",
+        manual_parameters=[
+            openapi.Parameter(name='order_by', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=list(TOP_CLIENTS_ORDERING), default='total_spent'),
+            openapi.Parameter(name='limit', in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, default=10),
+            openapi.Parameter(name='last_visit_before', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              format=openapi.FORMAT_DATE),
+        ],
+        responses={
+            200: SwaggerClientTopViewResponse(many=True),
+            400: "Неверные входные данные",
+        })
+    def get(self, request):
+        order_by = request.query_params.get('order_by', 'total_spent')
+        if order_by not in TOP_CLIENTS_ORDERING:
+            return Response({"error": "order_by must be one of: total_spent, visits_count, last_visit_at."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+            last_visit_before = request.query_params.get('last_visit_before')
+            last_visit_before = date.fromisoformat(last_visit_before) if last_visit_before else None
+        except ValueError:
+            return Response({"error": "Invalid limit or last_visit_before."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= 100:
+            return Response({"error": "limit must be between 1 and 100."}, status=status.HTTP_400_BAD_REQUEST)
+
+        clients = ClientLoyalty.objects.filter(company_id=request.user.company_id, last_visit_at__isnull=False)
+        if last_visit_before:
+            clients = clients.filter(
+                last_visit_at__lt=timezone.make_aware(datetime.combine(last_visit_before, datetime.min.time())),
+            )
+
+        top = clients.order_by(f'-{order_by}').values(*CLIENT_STATS_FIELDS, first_name=F('client__first_name'))[:limit]
+        return Response(list(top), status=status.HTTP_200_OK)
+
+
+class ClientSegmentView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
+    @swagger_auto_schema(
+        tags=["Client"],
+        operation_summary="Сегмент клиентов компании",
+        operation_id="client_segment",
+        operation_description="Число клиентов, подходящих под комбинацию условий, и страница этих клиентов "
+                              "по возрастанию id. Условия проверяются по индексу в памяти, который "
+                              "обновляется раз в минуту.",
+        request_body=SwaggerClientSegmentView,
+        responses={
+            200: SwaggerClientSegmentViewResponse(),
+            400: "Неверные входные данные",
+        })
+    def post(self, request):
+        predicate = request.data.get('filter')
+        if predicate is None:
+            return Response({"error": "filter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            offset = int(request.data.get('offset', 0))
+            limit = int(request.data.get('limit', 100))
+        except (TypeError, ValueError):
+            return Response({"error": "offset and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0 or not 1 <= limit <= 1000:
+            return Response({"error": "offset must be >= 0 and limit between 1 and 1000."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+        index = get_segment_index(company_id)
+        segment = index.evaluate(predicate)
+        client_ids = index.page(segment, offset, limit)
+
+        results = ClientLoyalty.objects.filter(company_id=company_id, client_id__in=client_ids).order_by(
+            'client_id').values(*CLIENT_STATS_FIELDS, first_name=F('client__first_name'))
+        return Response({
+            "count": segment.bit_count(),
+            "offset": offset,
+            "limit": limit,
+            "results": list(results),
+        }, status=status.HTTP_200_OK)
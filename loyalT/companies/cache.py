@@ -0,0 +1,140 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.singleflight import SingleFlight
+from utils.versions import bump_versions, get_versions
+
+from .models import Company
+
+COMPANY_SETTINGS_CACHE_KEY = 'companies:settings:{company_id}'
+COMPANY_SETTINGS_CACHE_TIMEOUT = 60 * 60
+
+CATALOG_VERSION_CACHE_KEY = 'companies:catalog_version'
+STATS_VERSION_CACHE_KEY = 'companies:stats_version:{company_id}'
+STATS_HISTORY_VERSION_CACHE_KEY = 'companies:stats_history_version:{company_id}'
+STATS_CACHE_KEY = 'companies:stats:{company_id}:{endpoint}:{params}'
+# Срез прошедших дней привязан к версии истории, срез за сегодня — к версии статистики.
+# Короткий срок для сегодняшнего ограничивает объем кэша: его ключ меняется с каждой продажей.
+STATS_CACHE_TIMEOUT = 60 * 60
+STATS_LIVE_CACHE_TIMEOUT = 60
+# Сколько воркер ждет, пока другой воркер досчитает тот же срез
+STATS_LOCK_TIMEOUT = 10
+STATS_LOCK_POLL_INTERVAL = 0.1
+
+stats_flights = SingleFlight()
+
+
+def get_company_settings(company_id):
+    """Возвращает настройки программы лояльности компании: max_sale и bonus_points_ratio."""
+    key = COMPANY_SETTINGS_CACHE_KEY.format(company_id=company_id)
+    company_settings = cache.get(key)
+    if company_settings is None:
+        company_settings = Company.objects.filter(id=company_id).values('max_sale', 'bonus_points_ratio').first()
+        cache.set(key, company_settings, COMPANY_SETTINGS_CACHE_TIMEOUT)
+    return company_settings
+
+
+def invalidate_company_settings(company_id):
+    cache.delete(COMPANY_SETTINGS_CACHE_KEY.format(company_id=company_id))
+
+
+def bump_catalog_version():
+    """Сдвигает версию каталога компаний, от которой зависят ETag клиентских ответов."""
+    bump_versions([CATALOG_VERSION_CACHE_KEY])
+
+
+def bump_stats_version(company_ids, history=False):
+    """Сдвигает версии статистики компаний после коммита текущей транзакции.
+
+    history=True сдвигает и версию истории: нужно, когда меняются итоги прошедших дней.
+    """
+    keys = [STATS_VERSION_CACHE_KEY.format(company_id=company_id) for company_id in company_ids]
+    if history:
+        keys += [STATS_HISTORY_VERSION_CACHE_KEY.format(company_id=company_id) for company_id in company_ids]
+    bump_versions(keys)
+
+
+def merge_rows(key, counters):
+    """merge для cached_stats: строки срезов с одинаковым ключом складываются по counters.
+
+    Строки сегодняшнего среза идут первыми, поэтому ряды по убыванию даты остаются упорядоченными.
+    """
+    def merge(past, live):
+        rows = {}
+        for row in live + past:
+            row_key = tuple(row[field] for field in key)
+            if row_key in rows:
+                merged = rows[row_key]
+                for counter in counters:
+                    merged[counter] += row[counter]
+            else:
+                rows[row_key] = dict(row)
+        return list(rows.values())
+
+    return merge
+
+
+def cached_stats(company_id, endpoint, params, from_date, to_date, compute, merge=None):
+    """Статистика за дни from_date..to_date: прошедшие дни и сегодняшний кэшируются отдельно.
+
+    compute(from_date, to_date) считает срез. Срез прошедших дней привязан к версии истории,
+    которую сдвигают пересборка итогов и продажи, попавшие в прошедший день; срез с сегодняшним
+    днем — к версии статистики, поэтому обычная продажа пересчитывает только его.
+    merge(past, live) склеивает срезы, если нужны оба.
+    """
+    today = timezone.localdate()
+    history_version, version = get_versions([STATS_HISTORY_VERSION_CACHE_KEY.format(company_id=company_id),
+                                             STATS_VERSION_CACHE_KEY.format(company_id=company_id)])
+    past = live = None
+    if from_date < today:
+        past_to = min(to_date, today - timedelta(days=1))
+        key = STATS_CACHE_KEY.format(company_id=company_id, endpoint=endpoint,
+                                     params=f'{from_date}:{past_to}:{params}') + f':h{history_version}'
+        past = _cached(key, STATS_CACHE_TIMEOUT, lambda: compute(from_date, past_to))
+    if to_date >= today:
+        live_from = max(from_date, today)
+        key = STATS_CACHE_KEY.format(company_id=company_id, endpoint=endpoint,
+                                     params=f'{live_from}:{to_date}:{params}') + f':v{version}'
+        live = _cached(key, STATS_LIVE_CACHE_TIMEOUT, lambda: compute(live_from, to_date))
+
+    if past is None and live is None:
+        # Пустой период (to_date раньше from_date): кэшировать нечего
+        return compute(from_date, to_date)
+    if past is None:
+        return live
+    if live is None:
+        return past
+    return merge(past, live)
+
+
+def _cached(key, timeout, compute):
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    # Промахи по одному ключу в воркере ждут друг друга, а между воркерами — блокировку в кэше
+    with stats_flights.lock(key):
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+        lock_key = f'{key}:lock'
+        locked = cache.add(lock_key, True, STATS_LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.monotonic() + STATS_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(STATS_LOCK_POLL_INTERVAL)
+                result = cache.get(key)
+                if result is not None:
+                    return result
+            # Другой воркер не успел или упал: считаем сами
+        try:
+            result = compute()
+            cache.set(key, result, timeout)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+    return result
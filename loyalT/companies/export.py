@@ -0,0 +1,68 @@
+import csv
+import json
+from datetime import datetime, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from transactions.models import Transaction
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = {
+    'transaction_id': 'id',
+    'created_at': 'created_at',
+    'cashier_id': 'cashier_id',
+    'client_id': 'client_id',
+    'price': 'price',
+    'price_with_sale': 'price_with_sale',
+    'points_used': 'points_used',
+    'points_earned': 'points_earned',
+    'item_id': 'transactionitem__item_id',
+    'quantity': 'transactionitem__quantity',
+    'sell_price': 'transactionitem__sell_price',
+    'origin_price': 'transactionitem__origin_price',
+}
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи в буфер."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(company_id, from_date=None, to_date=None):
+    """Продажи компании с их позициями, по одной строке на позицию.
+
+    Позиции присоединяются LEFT JOIN, поэтому продажа без позиций дает одну строку с пустыми
+    полями позиции. Читается серверным курсором пачками по EXPORT_CHUNK_SIZE, поэтому память
+    не зависит от объема истории.
+    """
+    transactions = Transaction.objects.filter(company_id=company_id)
+    if from_date:
+        start = timezone.make_aware(datetime.combine(from_date, datetime.min.time()))
+        transactions = transactions.filter(created_at__gte=start)
+    if to_date:
+        end = timezone.make_aware(datetime.combine(to_date + timedelta(days=1), datetime.min.time()))
+        transactions = transactions.filter(created_at__lt=end)
+    return transactions.order_by('id', 'transactionitem__id').values_list(*EXPORT_FIELDS.values()).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE,
+    )
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+from companies.cache import bump_stats_version
+from companies.models import CompanyDailyStats
+from transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Пересобирает CompanyDailyStats из существующих транзакций"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help="id компании; по умолчанию пересобираются все")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        transactions = Transaction.objects.all()
+        stats = CompanyDailyStats.objects.all()
+        if options['company']:
+            transactions = transactions.filter(company_id=options['company'])
+            stats = stats.filter(company_id=options['company'])
+
+        daily = transactions.values('company_id', day=TruncDate('created_at')).annotate(
+            total_price=Sum('price'),
+            total_points_earned=Sum('points_earned'),
+            transactions_count=Count('id'),
+            loyal_count=Count('id', filter=Q(client_id__isnull=False)),
+            no_loyal_count=Count('id', filter=Q(client_id__isnull=True)),
+        )
+
+        with transaction.atomic():
+            # Продажи ждут конца пересборки, а закоммиченные до блокировки уже попадут в агрегат
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(CompanyDailyStats._meta.db_table)} "
+                               f"IN EXCLUSIVE MODE")
+            rows = [CompanyDailyStats(**row) for row in daily.iterator()]
+            # Сдвигаются версии и компаний, у которых итоги только удалились
+            companies = set(stats.values_list('company_id', flat=True).distinct())
+            deleted, _ = stats.delete()
+            CompanyDailyStats.objects.bulk_create(rows, batch_size=options['batch_size'])
+            bump_stats_version(companies | {row.company_id for row in rows}, history=True)
+
+        self.stdout.write(f"daily rows deleted: {deleted}, created: {len(rows)}")
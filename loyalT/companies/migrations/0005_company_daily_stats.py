@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0004_company_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyDailyStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_points_earned', models.BigIntegerField(default=0)),
+                ('transactions_count', models.BigIntegerField(default=0)),
+                ('loyal_count', models.BigIntegerField(default=0)),
+                ('no_loyal_count', models.BigIntegerField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='companies.company')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'day'), name='company_daily_stats_company_day')],
+            },
+        ),
+    ]
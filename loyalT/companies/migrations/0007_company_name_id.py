@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:17
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('companies', '0006_search'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='company',
+            index=models.Index(fields=['name', 'id'], name='company_name_id'),
+        ),
+    ]
@@ -2,8 +2,12 @@ import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from utils.search import search_vector
+
 
 class Company(AbstractBaseUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -13,6 +17,11 @@ class Company(AbstractBaseUser):
     max_sale = models.DecimalField(decimal_places=2, max_digits=3, default=0.5)
     bonus_points_ratio = models.DecimalField(decimal_places=2, max_digits=3, default=0.2)
     description = models.TextField(null=True, blank=True)
+    search_vector = models.GeneratedField(
+        expression=search_vector('name', 'description'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -24,5 +33,30 @@ class Company(AbstractBaseUser):
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ('name', 'password')
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="company_search_vector"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="company_name_trgm"),
+            # Каталог компаний клиента: keyset по (name, id)
+            models.Index(fields=["name", "id"], name="company_name_id"),
+        ]
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class CompanyDailyStats(models.Model):
+    """Дневные итоги продаж компании, обновляются в транзакции продажи."""
+    id = models.BigAutoField(primary_key=True)
+    company = models.ForeignKey(Company, related_name="daily_stats", on_delete=models.CASCADE)
+    day = models.DateField()
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_points_earned = models.BigIntegerField(default=0)
+    transactions_count = models.BigIntegerField(default=0)
+    loyal_count = models.BigIntegerField(default=0)
+    no_loyal_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["company", "day"], name="company_daily_stats_company_day"),
+        ]
@@ -7,7 +7,7 @@ class IsUserCompany(BasePermission):
         if not request.user or not request.user.is_authenticated:
             return
 
-        return hasattr(request.user, 'company') and request.user.company is not None
+        return request.user.company_id is not None and request.user.cashier_id is None
 
     def has_object_permission(self, request, view, obj):
-        return obj.company == request.user.company
+        return obj.company_id == request.user.company_id
@@ -3,6 +3,7 @@ from django.db import IntegrityError
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainSlidingSerializer
 
+from users.auth.tokens import LoyalTSlidingToken
 from utils.validators import validate_password
 
 from .models import Company
@@ -46,11 +47,22 @@ class CompanySerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'password', 'name', 'max_sale', 'bonus_points_ratio', 'description',)
 
 
+class CompanySearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Company
+        fields = ('id', 'name', 'description', 'max_sale', 'bonus_points_ratio')
+
+
+class SwaggerSearchQuery(serializers.Serializer):
+    q = serializers.CharField(max_length=255, help_text="Поисковый запрос: слова, \"фразы\" и -исключения")
+
+
 class CompanyTokenObtainSlidingSerializer(
     # InvalidateOldTokenSerializerMixin,
     TokenObtainSlidingSerializer
 ):
     username_field = Company.USERNAME_FIELD
+    token_class = LoyalTSlidingToken
 
 
 class SwaggerCompanySerializerResponse(serializers.Serializer):
@@ -74,7 +86,10 @@ class SwaggerCompanyMoneyDailyStatsViewResponse(serializers.Serializer):
 
 
 class SwaggerCompanyMoneyDayHourlyStatsView(serializers.Serializer):
-    date = serializers.DateField()
+    mode = serializers.ChoiceField(choices=("hourly", "heatmap"), default="hourly")
+    date = serializers.DateField(required=False, help_text="Для mode=hourly")
+    from_date = serializers.DateField(required=False, help_text="Для mode=heatmap")
+    to_date = serializers.DateField(required=False, help_text="Для mode=heatmap")
 
 
 class SwaggerCompanyMoneyDayHourlyStatsViewResponse(serializers.Serializer):
@@ -82,6 +97,36 @@ class SwaggerCompanyMoneyDayHourlyStatsViewResponse(serializers.Serializer):
     total_points_earned = serializers.IntegerField()
     total_price = serializers.DecimalField(decimal_places=2, max_digits=8)
 
+
+class SwaggerCompanyMoneyHeatmapResponse(serializers.Serializer):
+    class HourSerializer(serializers.Serializer):
+        hour = serializers.IntegerField(min_value=0, max_value=23)
+        total_points_earned = serializers.IntegerField()
+        total_price = serializers.DecimalField(decimal_places=2, max_digits=30)
+        transactions_count = serializers.IntegerField()
+
+    weekday = serializers.IntegerField(min_value=1, max_value=7, help_text="ISO: 1 — понедельник, 7 — воскресенье")
+    hours = HourSerializer(many=True)
+
+class SwaggerCompanyItemStatsView(SwaggerCompanyMoneyDailyStatsView):
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class ItemStatsSerializerResponse(serializers.Serializer):
+    item_id = serializers.UUIDField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(decimal_places=2, max_digits=30)
+    origin_revenue = serializers.DecimalField(decimal_places=2, max_digits=30)
+    average_discount = serializers.DecimalField(decimal_places=4, max_digits=5)
+
+
+class SwaggerCompanyItemStatsViewResponse(serializers.Serializer):
+    top_by_revenue = ItemStatsSerializerResponse(many=True)
+    top_by_quantity = ItemStatsSerializerResponse(many=True)
+    average_discount = serializers.DecimalField(decimal_places=4, max_digits=5,
+                                                help_text="Доля скидки от цены прайса за период")
+
 class ResultSerializerResponse(serializers.Serializer):
     date = serializers.DateField()
     total_price = serializers.DecimalField(decimal_places=2, max_digits=30)
@@ -91,3 +136,19 @@ class ResultSerializerResponse(serializers.Serializer):
 class SwaggerCompanyMoneyCashierDailyStatsViewResponse(serializers.Serializer):
     cashier_name = serializers.CharField(max_length=255)
     result = ResultSerializerResponse(many=True)
+
+
+class SwaggerCompanyMoneyCashierStatsView(SwaggerCompanyMoneyDailyStatsView):
+    mode = serializers.ChoiceField(choices=("daily", "leaderboard"), default="daily")
+
+
+class SwaggerCompanyCashierLeaderboardResponse(serializers.Serializer):
+    cashier_id = serializers.UUIDField()
+    cashier_name = serializers.CharField(max_length=255)
+    total_price = serializers.DecimalField(decimal_places=2, max_digits=30)
+    total_points_earned = serializers.IntegerField()
+    transactions_count = serializers.IntegerField()
+    average_ticket = serializers.DecimalField(decimal_places=2, max_digits=30)
+    revenue_rank = serializers.IntegerField()
+    points_rank = serializers.IntegerField()
+    average_ticket_rank = serializers.IntegerField()
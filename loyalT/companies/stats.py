@@ -0,0 +1,170 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, TruncDate, TruncHour
+from django.utils import timezone
+
+from transactions.models import Transaction
+from utils.rollups import increment_rollup
+from .cache import bump_stats_version
+from .models import CompanyDailyStats
+
+COUNTERS = ('total_price', 'total_points_earned', 'transactions_count', 'loyal_count', 'no_loyal_count')
+
+
+def daily_totals(transactions):
+    """Суммирует продажи по (company_id, day) в порядке, одинаковом для всех воркеров."""
+    totals = {}
+    for transaction_obj in transactions:
+        key = (transaction_obj.company_id, timezone.localdate(transaction_obj.created_at))
+        row = totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        row['total_price'] += transaction_obj.price
+        row['total_points_earned'] += transaction_obj.points_earned
+        row['transactions_count'] += 1
+        row['loyal_count' if transaction_obj.client_id else 'no_loyal_count'] += 1
+    return sorted(totals.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+
+
+def record_transactions(transactions):
+    """Прибавляет продажи к CompanyDailyStats в транзакции продажи.
+
+    Итоги и продажи фиксируются вместе, а после коммита сдвигается версия закэшированной
+    статистики компаний.
+    """
+    totals = daily_totals(transactions)
+    increment_rollup(CompanyDailyStats, ('company_id', 'day'), COUNTERS, totals)
+    if totals:
+        bump_stats_version({company_id for (company_id, day), row in totals})
+
+        # Продажа, закоммиченная после полуночи, попадает во вчерашний день — в срез истории
+        def bump_history():
+            today = timezone.localdate()
+            companies = {company_id for (company_id, day), row in totals if day < today}
+            if companies:
+                bump_stats_version(companies, history=True)
+
+        transaction.on_commit(bump_history)
+
+
+def period_transactions(company_id, from_date, to_date):
+    """Транзакции компании за дни from_date..to_date включительно, по диапазону created_at."""
+    start = timezone.make_aware(datetime.combine(from_date, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(to_date + timedelta(days=1), datetime.min.time()))
+    return Transaction.objects.filter(company_id=company_id, created_at__gte=start, created_at__lt=end)
+
+
+def hourly_totals(company_id, day):
+    """Выручка и баллы по 24 часам дня; часы без продаж заполняются нулями."""
+    totals = {
+        row['hour'].hour: row
+        for row in period_transactions(company_id, day, day).values(hour=TruncHour('created_at')).annotate(
+            total_points_earned=Sum('points_earned'),
+            total_price=Sum('price'),
+        )
+    }
+    hours = []
+    for hour in range(24):
+        row = totals.get(hour, {})
+        hours.append({
+            "hour": datetime.combine(day, datetime.min.time()).replace(hour=hour),
+            "total_points_earned": row.get('total_points_earned', 0),
+            "total_price": row.get('total_price', 0),
+        })
+    return hours
+
+
+def weekday_hour_totals(company_id, from_date, to_date):
+    """Итоги по (день недели, час) за период, одним GROUP BY."""
+    return list(period_transactions(company_id, from_date, to_date).values(
+        weekday=ExtractIsoWeekDay('created_at'),
+        hour=ExtractHour('created_at'),
+    ).annotate(
+        total_points_earned=Sum('points_earned'),
+        total_price=Sum('price'),
+        transactions_count=Count('id'),
+    ))
+
+
+def weekday_hour_heatmap(rows):
+    """Матрица день недели × час из weekday_hour_totals; пустые часы заполняются нулями."""
+    totals = {(row['weekday'], row['hour']): row for row in rows}
+    heatmap = []
+    for weekday in range(1, 8):
+        hours = []
+        for hour in range(24):
+            row = totals.get((weekday, hour), {})
+            hours.append({
+                "hour": hour,
+                "total_points_earned": row.get('total_points_earned', 0),
+                "total_price": row.get('total_price', 0),
+                "transactions_count": row.get('transactions_count', 0),
+            })
+        heatmap.append({"weekday": weekday, "hours": hours})
+    return heatmap
+
+
+def cashier_day_totals(company_id, from_date, to_date):
+    """Выручка и баллы кассиров по дням; имя кассира берется в том же запросе."""
+    return list(period_transactions(company_id, from_date, to_date).values(
+        'cashier_id', cashier_name=F('cashier__username'), day=TruncDate('created_at'),
+    ).annotate(
+        total_points_earned=Sum('points_earned'),
+        total_price=Sum('price')
+    ))
+
+
+def cashier_daily_totals(rows):
+    """Группирует cashier_day_totals по кассирам: кассиры по id, дни по убыванию."""
+    rows = sorted(rows, key=lambda stat: stat['day'], reverse=True)
+    rows.sort(key=lambda stat: stat['cashier_id'])
+
+    result = {}
+    for stat in rows:
+        cashier_name = stat['cashier_name']
+        if cashier_name not in result:
+            result[cashier_name] = {
+                'cashier_name': cashier_name,
+                'result': []
+            }
+        result[cashier_name]['result'].append({
+            'date': stat['day'],
+            'total_price': stat['total_price'],
+            'total_points_earned': stat['total_points_earned']
+        })
+    return list(result.values())
+
+
+def cashier_totals(company_id, from_date, to_date):
+    """Выручка, баллы и число чеков кассиров за период, одним запросом."""
+    return list(period_transactions(company_id, from_date, to_date).values(
+        'cashier_id',
+        cashier_name=F('cashier__username'),
+    ).annotate(
+        total_price=Sum('price'),
+        total_points_earned=Sum('points_earned'),
+        transactions_count=Count('id'),
+    ))
+
+
+def cashier_leaderboard(rows):
+    """Рейтинг кассиров из cashier_totals по выручке, выданным баллам и среднему чеку.
+
+    Места считаются как RANK(): равные значения делят место, следующее место пропускается.
+    """
+    leaderboard = [dict(row, average_ticket=row['total_price'] / row['transactions_count']) for row in rows]
+
+    def rank(metric):
+        # Место — 1 плюс число строго больших значений, их находит бисекция по отсортированным значениям
+        values = sorted(row[metric] for row in leaderboard)
+        for row in leaderboard:
+            row[f'{metric}_rank'] = len(values) - bisect_right(values, row[metric]) + 1
+
+    rank('total_price')
+    rank('total_points_earned')
+    rank('average_ticket')
+    for row in leaderboard:
+        row['revenue_rank'] = row.pop('total_price_rank')
+        row['points_rank'] = row.pop('total_points_earned_rank')
+    return sorted(leaderboard, key=lambda row: (row['revenue_rank'], row['cashier_name']))
@@ -1,3 +1,4 @@
+from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 
@@ -5,6 +6,8 @@ from companies.models import Company
 from companies.serializers import CompanySerializer
 import pytest
 
+User = get_user_model()
+
 
 @pytest.mark.django_db
 class CompanyTests(APITestCase):
@@ -235,3 +238,31 @@ class SerializerTests(APITestCase):
         for i in self.keys_for_fail_update:
             self.for_check = self.good_data | i
             self.assertFalse(CompanySerializer(data=self.for_check).is_valid(), msg=f"error in pair: {i}")
+
+
+@pytest.mark.django_db
+class CompanySearchTests(APITestCase):
+    def setUp(self):
+        self.url = "/api/company/search/"
+        for name, username, description in (
+                ("Кофейня на углу", "corner", "свежий кофе и выпечка"),
+                ("Книжный магазин", "books", "книги и кофе навынос"),
+                ("Цветочная лавка", "flowers", "букеты"),
+        ):
+            Company.objects.create(user=User.objects.create(), name=name, username=username, description=description)
+
+    def test_search_ranks_name_matches_first(self):
+        response = self.client.get(self.url, {"q": "кофейни"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["name"], "Кофейня на углу")
+
+    def test_search_by_description_and_typo(self):
+        names = [c["name"] for c in self.client.get(self.url, {"q": "кофе"}).data["results"]]
+        self.assertCountEqual(names, ["Кофейня на углу", "Книжный магазин"])
+
+        names = [c["name"] for c in self.client.get(self.url, {"q": "цвеочная"}).data["results"]]
+        self.assertEqual(names, ["Цветочная лавка"])
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.url, {"q": "  "})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from companies.views import (CompanyView, CompanyTokenObtainSlidingView, CompanyRegisterAPIView, CompanyCashierViewSet, \
                              CompanyMoneyDayHourlyStatsView, CompanyMoneyDailyStatsView,
-                             CompanyMoneyCashierDailyStatsView, )
+                             CompanyMoneyCashierDailyStatsView, CompanyTransactionsExportView,
+                             CompanyItemStatsView, )
 
 router = DefaultRouter()
 router.register(r'', CompanyView, basename='company')
@@ -15,6 +16,8 @@ urlpatterns = [
     path('stats/money/', CompanyMoneyDayHourlyStatsView.as_view(), name='company-stats'),
     path('stats/money/daily/', CompanyMoneyDailyStatsView.as_view(), name='company-stats'),
     path('stats/money/cashier/daily/', CompanyMoneyCashierDailyStatsView.as_view(), name='company-stats'),
+    path('stats/items/', CompanyItemStatsView.as_view(), name='company-stats-items'),
+    path('transactions/export/', CompanyTransactionsExportView.as_view(), name='company-transactions-export'),
 ]
 
 urlpatterns += router.urls
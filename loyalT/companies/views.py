@@ -1,14 +1,16 @@
+from datetime import date
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, F
-from django.db.models.functions import TruncDate, TruncHour
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from rest_framework import status, mixins, viewsets, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
-from rest_framework_simplejwt.tokens import SlidingToken
+from users.auth.tokens import LoyalTSlidingToken
+from users.auth.versions import revoke_user_tokens
+from utils.search import ranked_search, search_query_param
 from rest_framework_simplejwt.views import TokenObtainSlidingView
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -16,14 +18,20 @@ from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, Ou
 
 from cashiers.serializers import CashierSerializer
 from cashiers.models import Cashier
-from companies.models import Company
+from companies.cache import bump_catalog_version, cached_stats, invalidate_company_settings, merge_rows
+from companies.export import EXPORT_FORMATS, export_rows
+from companies.stats import cashier_daily_totals, cashier_day_totals, cashier_leaderboard, cashier_totals, \
+    hourly_totals, weekday_hour_heatmap, weekday_hour_totals
+from companies.models import Company, CompanyDailyStats
 from companies.serializers import CompanySerializer, CompanyTokenObtainSlidingSerializer, \
+    CompanySearchSerializer, SwaggerSearchQuery, \
     SwaggerCompanySerializerResponse, SwaggerCompanyMoneyDailyStatsView, SwaggerCompanyMoneyDailyStatsViewResponse, \
     SwaggerCompanyMoneyDayHourlyStatsView, SwaggerCompanyMoneyDayHourlyStatsViewResponse, \
-    SwaggerCompanyMoneyCashierDailyStatsViewResponse
+    SwaggerCompanyMoneyCashierDailyStatsViewResponse, SwaggerCompanyMoneyCashierStatsView, \
+    SwaggerCompanyItemStatsView, SwaggerCompanyItemStatsViewResponse
 from companies.permissions import IsUserCompany
+from items.stats import item_analytics, item_totals
 from transaction_items.models import TransactionItem
-from transactions.models import Transaction
 
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -56,7 +64,7 @@ class CompanyView(
     )
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.user != request.user:
+        if instance.user_id != request.user.id:
             return Response(
                 {"detail": "Вы не можете получить информацию о компании другого пользователя"},
                 status=status.HTTP_403_FORBIDDEN
@@ -79,16 +87,58 @@ class CompanyView(
     def partial_update(self, request, *args, **kwargs):
         instance = self.get_object()
 
-        if instance.user != request.user:
+        if instance.user_id != request.user.id:
             return Response(
                 {"detail": "Вы не можете изменить информацию о компании другого пользователя"},
                 status=status.HTTP_403_FORBIDDEN
             )
         return super().update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        company = serializer.save()
+        invalidate_company_settings(company.id)
+        bump_catalog_version()
+
     def get_serializer_context(self):
         return {'request': self.request}
 
+    @swagger_auto_schema(
+        tags=["Company"],
+        method='get',
+        operation_id="search_companies",
+        operation_summary="Поиск компаний",
+        operation_description="Полнотекстовый поиск по названию и описанию компаний с учетом опечаток в названии. "
+                              "Результаты упорядочены по релевантности и разбиты на страницы (limit/offset).",
+        query_serializer=SwaggerSearchQuery,
+        responses={
+            200: CompanySearchSerializer(many=True),
+            400: "Пустой поисковый запрос"
+        }
+    )
+    @action(methods=["get"], detail=False, url_path="search", permission_classes=(AllowAny,))
+    def search(self, request):
+        query = search_query_param(request)
+        if query is None:
+            return Response({"detail": "Параметр q обязателен"}, status=status.HTTP_400_BAD_REQUEST)
+        companies = ranked_search(Company.objects.only(*CompanySearchSerializer.Meta.fields), query)
+        page = self.paginate_queryset(companies)
+        return self.get_paginated_response(CompanySearchSerializer(page, many=True).data)
+
+    @swagger_auto_schema(
+        tags=["Company"],
+        method='post',
+        operation_id="company_logout_all",
+        operation_summary="Выход со всех устройств",
+        operation_description="Инвалидирует все выданные компании токены, включая текущий.",
+        responses={
+            200: "Успешный выход"
+        }
+    )
+    @action(methods=["post"], detail=False, url_path="logout/all", permission_classes=(IsAuthenticated, IsUserCompany))
+    def logout_all(self, request):
+        revoke_user_tokens(request.user.id)
+        return Response(status=status.HTTP_200_OK)
+
     @swagger_auto_schema(
         tags=["Company"],
         method='post',
@@ -105,9 +155,8 @@ class CompanyView(
     def logout(self, request):
         try:
             jti = request.auth['jti']
-            user = request.user
 
-            outstanding_token = OutstandingToken.objects.get(jti=jti, user=user)
+            outstanding_token = OutstandingToken.objects.get(jti=jti, user_id=request.user.id)
 
             BlacklistedToken.objects.create(token=outstanding_token)
 
@@ -151,10 +200,11 @@ class CompanyRegisterAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         company = serializer.save()
+        bump_catalog_version()
         return Response(
             data={
                 "company_id": company.id,
-                "token": str(SlidingToken.for_user(company.user))
+                "token": str(LoyalTSlidingToken.for_user(company.user))
             },
             status=status.HTTP_200_OK
         )
@@ -198,7 +248,7 @@ class CompanyTokenObtainSlidingView(TokenObtainSlidingView):
 
         return Response(
             serializer.validated_data | {
-                'company_id': serializer.user.company.id
+                'company_id': serializer.user.company_id
             },
             status=status.HTTP_200_OK
         )
@@ -262,9 +312,9 @@ class CompanyCashierViewSet(
         cashier = serializer.save()
         return Response(
             data={
-                "company_id": request.user.company.id,
+                "company_id": request.user.company_id,
                 "cashier_id": cashier.id,
-                "token": str(SlidingToken.for_user(cashier.user))
+                "token": str(LoyalTSlidingToken.for_user(cashier.user))
             },
             status=status.HTTP_200_OK
         )
@@ -305,11 +355,62 @@ class CompanyCashierViewSet(
         obj = self.get_object()
         obj.status = "INACTIVE"
         obj.save()
+        revoke_user_tokens(obj.user_id)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class CompanyTransactionsExportView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
+    @swagger_auto_schema(
+        tags=["Company"],
+        operation_summary="Выгрузка истории продаж компании",
+        operation_description="Потоковая выгрузка позиций продаж вместе с полями их транзакций, "
+                              "по одной строке на позицию. Ответ отдается по мере чтения из базы.",
+        manual_parameters=[
+            openapi.Parameter(
+                name='export_format',
+                in_=openapi.IN_QUERY,
+                description="csv (по умолчанию) или ndjson",
+                type=openapi.TYPE_STRING,
+                enum=list(EXPORT_FORMATS),
+            ),
+            openapi.Parameter(name='from_date', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              format=openapi.FORMAT_DATE),
+            openapi.Parameter(name='to_date', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              format=openapi.FORMAT_DATE),
+        ],
+        responses={
+            200: "Файл выгрузки",
+            400: "Неверные данные",
+            403: "Доступ запрещен",
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": "export_format must be one of: csv, ndjson."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            from_date, to_date = (
+                date.fromisoformat(value) if value else None
+                for value in (request.query_params.get('from_date'), request.query_params.get('to_date'))
+            )
+        except ValueError:
+            return Response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        stream, content_type = EXPORT_FORMATS[export_format]
+        rows = export_rows(request.user.company_id, from_date, to_date)
+        response = StreamingHttpResponse(stream(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+        return response
+
+
 class CompanyMoneyDailyStatsView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
     @swagger_auto_schema(
         tags=["Company"],
         operation_summary="Статистика по деньгам компании",
@@ -328,23 +429,33 @@ class CompanyMoneyDailyStatsView(APIView):
         if not from_date or not to_date:
             return Response({"error": "Both from_date and to_date are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        transactions = Transaction.objects.filter(
-            company_id=request.user.company.id,
-            created_at__range=[from_date, to_date]
-        ).annotate(day=TruncDate('created_at'))
-
-        daily_stats = transactions.values('day').annotate(
-            total_points_earned=Sum('points_earned'),
-            total_price=Sum('price')
-        ).order_by('-day')
+        try:
+            from_date, to_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+        except ValueError:
+            return Response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+        daily_stats = cached_stats(
+            company_id, 'money_daily', '', from_date, to_date,
+            lambda from_day, to_day: list(CompanyDailyStats.objects.filter(
+                company_id=company_id,
+                day__range=[from_day, to_day]
+            ).values('day', 'total_points_earned', 'total_price').order_by('-day')),
+            merge_rows(('day',), ('total_points_earned', 'total_price')),
+        )
 
         return Response(daily_stats, status=status.HTTP_200_OK)
 
 
 class CompanyMoneyDayHourlyStatsView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
     @swagger_auto_schema(
         tags=["Company"],
         operation_summary="Статистика по деньгам компании по часам",
+        operation_description="mode=hourly (по умолчанию) — 24 часа дня date. "
+                              "mode=heatmap — матрица день недели × час за период from_date..to_date "
+                              "в формате SwaggerCompanyMoneyHeatmapResponse.",
         request_body=SwaggerCompanyMoneyDayHourlyStatsView,
         responses={
             200: SwaggerCompanyMoneyDayHourlyStatsViewResponse(many=True),
@@ -354,35 +465,47 @@ class CompanyMoneyDayHourlyStatsView(APIView):
         }
     )
     def post(self, request, *args, **kwargs):
-        date = request.data.get('date')
-        if not date:
+        company_id = request.user.company_id
+
+        if request.data.get('mode') == 'heatmap':
+            from_date = request.data.get('from_date')
+            to_date = request.data.get('to_date')
+            if not from_date or not to_date:
+                return Response({"error": "Both from_date and to_date are required."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                from_date, to_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+            except ValueError:
+                return Response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+            totals = cached_stats(company_id, 'money_heatmap', '', from_date, to_date,
+                                  lambda from_day, to_day: weekday_hour_totals(company_id, from_day, to_day),
+                                  merge_rows(('weekday', 'hour'),
+                                             ('total_points_earned', 'total_price', 'transactions_count')))
+            return Response(weekday_hour_heatmap(totals), status=status.HTTP_200_OK)
+
+        specified_date = request.data.get('date')
+        if not specified_date:
             return Response({"error": "Date is required."}, status=status.HTTP_400_BAD_REQUEST)
-        company_id = request.user.company.id
-
-        specified_date = timezone.datetime.strptime(date, '%Y-%m-%d')
-        hours = [{"hour": specified_date.replace(hour=i, minute=0, second=0, microsecond=0, tzinfo=None),
-                  "total_points_earned": 0,
-                  "total_price": 0} for i in range(24)]
-
-        transactions = Transaction.objects.filter(company_id=company_id,
-                                                  created_at__date=specified_date).annotate(
-            hour=TruncHour('created_at'))
-        for transaction in transactions:
-            transaction_hour = transaction.hour.replace(tzinfo=None)
-            for hour in hours:
-                hour_hour = hour["hour"].replace(tzinfo=None)
-                if transaction_hour == hour_hour:
-                    hour["total_points_earned"] += transaction.points_earned
-                    hour["total_price"] += transaction.price
 
+        try:
+            specified_date = date.fromisoformat(specified_date)
+        except ValueError:
+            return Response({"error": "Date must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+        hours = cached_stats(company_id, 'money_hourly', '', specified_date, specified_date,
+                             lambda day, _: hourly_totals(company_id, day))
         return Response(hours, status=status.HTTP_200_OK)
 
 
 class CompanyMoneyCashierDailyStatsView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
     @swagger_auto_schema(
         tags=["Company"],
         operation_summary="Статистика по деньгам компании по кассиру",
-        request_body=SwaggerCompanyMoneyDailyStatsView,
+        operation_description="mode=daily (по умолчанию) — выручка кассиров по дням. "
+                              "mode=leaderboard — рейтинг кассиров за период в формате "
+                              "SwaggerCompanyCashierLeaderboardResponse.",
+        request_body=SwaggerCompanyMoneyCashierStatsView,
         responses={
             200: SwaggerCompanyMoneyCashierDailyStatsViewResponse(many=True),
             400: "Неверные данные",
@@ -396,29 +519,56 @@ class CompanyMoneyCashierDailyStatsView(APIView):
         if not from_date or not to_date:
             return Response({"error": "Both from_date and to_date are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        company_id = request.user.company.id
-
-        transactions = Transaction.objects.filter(company_id=company_id,
-                                                  created_at__range=[from_date, to_date]).annotate(
-            day=TruncDate('created_at'))
-
-        daily_stats = transactions.values('cashier_id', 'day').annotate(
-            total_points_earned=Sum('points_earned'),
-            total_price=Sum('price')
-        ).order_by('cashier_id', '-day')
-
-        result = {}
-        for stat in daily_stats:
-            cashier_name = Cashier.objects.get(id=stat['cashier_id']).user.username
-            if cashier_name not in result:
-                result[cashier_name] = {
-                    'cashier_name': cashier_name,
-                    'result': []
-                }
-            result[cashier_name]['result'].append({
-                'date': stat['day'],
-                'total_price': stat['total_price'],
-                'total_points_earned': stat['total_points_earned']
-            })
-
-        return Response(list(result.values()))
+        try:
+            from_date, to_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+        except ValueError:
+            return Response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+
+        if request.data.get('mode') == 'leaderboard':
+            totals = cached_stats(company_id, 'cashier_leaderboard', '', from_date, to_date,
+                                  lambda from_day, to_day: cashier_totals(company_id, from_day, to_day),
+                                  merge_rows(('cashier_id',),
+                                             ('total_price', 'total_points_earned', 'transactions_count')))
+            return Response(cashier_leaderboard(totals), status=status.HTTP_200_OK)
+
+        totals = cached_stats(company_id, 'cashier_daily', '', from_date, to_date,
+                              lambda from_day, to_day: cashier_day_totals(company_id, from_day, to_day),
+                              merge_rows(('cashier_id', 'day'), ('total_points_earned', 'total_price')))
+        return Response(cashier_daily_totals(totals))
+
+
+class CompanyItemStatsView(APIView):
+    permission_classes = (IsAuthenticated, IsUserCompany,)
+
+    @swagger_auto_schema(
+        tags=["Company"],
+        operation_summary="Статистика по товарам компании",
+        operation_description="Топ товаров по выручке и количеству и средняя скидка от цены прайса за период.",
+        request_body=SwaggerCompanyItemStatsView,
+        responses={
+            200: SwaggerCompanyItemStatsViewResponse(),
+            400: "Неверные данные",
+            403: "Доступ запрещен",
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        from_date = request.data.get('from_date')
+        to_date = request.data.get('to_date')
+        if not from_date or not to_date:
+            return Response({"error": "Both from_date and to_date are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            from_date, to_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+            limit = int(request.data.get('limit', 10))
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid dates or limit."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= 100:
+            return Response({"error": "limit must be between 1 and 100."}, status=status.HTTP_400_BAD_REQUEST)
+
+        company_id = request.user.company_id
+        totals = cached_stats(company_id, 'items', '', from_date, to_date,
+                              lambda from_day, to_day: item_totals(company_id, from_day, to_day),
+                              merge_rows(('item_id',), ('quantity', 'revenue', 'origin_revenue')))
+        return Response(item_analytics(totals, limit), status=status.HTTP_200_OK)
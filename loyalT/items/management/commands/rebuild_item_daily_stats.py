@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+from companies.cache import bump_stats_version
+from items.models import ItemDailyStats
+from transaction_items.models import TransactionItem
+
+
+def line_total(price_field):
+    return Sum(ExpressionWrapper(F(price_field) * F('quantity'), output_field=DecimalField()))
+
+
+class Command(BaseCommand):
+    help = "Пересобирает ItemDailyStats из существующих позиций продаж"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help="id компании; по умолчанию пересобираются все")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        transaction_items = TransactionItem.objects.all()
+        stats = ItemDailyStats.objects.all()
+        if options['company']:
+            transaction_items = transaction_items.filter(transaction__company_id=options['company'])
+            stats = stats.filter(company_id=options['company'])
+
+        daily = transaction_items.values(
+            'item_id',
+            company_id=F('transaction__company_id'),
+            day=TruncDate('transaction__created_at'),
+        ).annotate(
+            quantity_sum=Sum('quantity'),
+            revenue=line_total('sell_price'),
+            origin_revenue=line_total('origin_price'),
+        )
+
+        with transaction.atomic():
+            # Продажи ждут конца пересборки, а закоммиченные до блокировки уже попадут в агрегат
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(ItemDailyStats._meta.db_table)} "
+                               f"IN EXCLUSIVE MODE")
+            rows = [
+                ItemDailyStats(
+                    company_id=row['company_id'], item_id=row['item_id'], day=row['day'],
+                    quantity=row['quantity_sum'], revenue=row['revenue'], origin_revenue=row['origin_revenue'],
+                )
+                for row in daily.iterator()
+            ]
+            # Сдвигаются версии и компаний, у которых итоги только удалились
+            companies = set(stats.values_list('company_id', flat=True).distinct())
+            deleted, _ = stats.delete()
+            ItemDailyStats.objects.bulk_create(rows, batch_size=options['batch_size'])
+            bump_stats_version(companies | {row.company_id for row in rows}, history=True)
+
+        self.stdout.write(f"item daily rows deleted: {deleted}, created: {len(rows)}")
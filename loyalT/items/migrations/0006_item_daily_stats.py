@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0005_company_daily_stats'),
+        ('items', '0005_alter_item_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemDailyStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('origin_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_daily_stats', to='companies.company')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='items.item')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'day', 'item'), name='item_daily_stats_company_day_item')],
+            },
+        ),
+    ]
@@ -1,9 +1,12 @@
 import enum
 import uuid
 from loyalT.minio import LoyalTMinioBackend
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from companies.models import Company
+from utils.search import search_vector
 
 
 def item_image_upload_to(instance, filename):
@@ -28,7 +31,34 @@ class Item(models.Model):
     price = models.DecimalField(decimal_places=2, max_digits=10)
     status = models.CharField(max_length=8, choices=STATUS_CHOICES, default="ACTIVE")
     description = models.TextField(null=True, blank=True)
+    search_vector = models.GeneratedField(
+        expression=search_vector('name', 'description'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="item_search_vector"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="item_name_trgm"),
+        ]
 
 class StatusEnum(enum.Enum):
     ACTIVE = "active"
     INACTIVE = "inactive"
+
+
+class ItemDailyStats(models.Model):
+    """Дневные продажи товара, обновляются в транзакции продажи."""
+    id = models.BigAutoField(primary_key=True)
+    company = models.ForeignKey(Company, related_name="item_daily_stats", on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, related_name="daily_stats", on_delete=models.CASCADE)
+    day = models.DateField()
+    quantity = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    origin_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["company", "day", "item"], name="item_daily_stats_company_day_item"),
+        ]
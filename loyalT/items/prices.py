@@ -0,0 +1,33 @@
+from django.core.cache import cache
+
+from utils.versions import bump_versions
+
+from .models import Item
+
+PRICE_TABLE_CACHE_KEY = 'items:prices:{company_id}'
+PRICE_TABLE_CACHE_TIMEOUT = 60 * 60
+ITEMS_VERSION_CACHE_KEY = 'items:version:{company_id}'
+
+
+def get_price_table(company_id, item_ids=()):
+    """Возвращает словарь {item_id: price} всех товаров компании.
+
+    Таблица загружается одним запросом и кэшируется до изменения товаров компании.
+    Если каких-то из item_ids в таблице нет, она один раз перечитывается из базы: товар
+    мог быть создан после того, как таблица попала в кэш.
+    """
+    key = PRICE_TABLE_CACHE_KEY.format(company_id=company_id)
+    prices = cache.get(key)
+    if prices is None or any(item_id not in prices for item_id in item_ids):
+        prices = dict(Item.objects.filter(company_id=company_id).values_list('id', 'price'))
+        cache.set(key, prices, PRICE_TABLE_CACHE_TIMEOUT)
+    return prices
+
+
+def invalidate_price_table(company_id):
+    cache.delete(PRICE_TABLE_CACHE_KEY.format(company_id=company_id))
+    bump_versions([ITEMS_VERSION_CACHE_KEY.format(company_id=company_id)])
+
+
+def items_version_keys(request, company_id, *args, **kwargs):
+    return [ITEMS_VERSION_CACHE_KEY.format(company_id=company_id)]
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from utils.rollups import increment_rollup
+from .models import ItemDailyStats
+
+COUNTERS = ('quantity', 'revenue', 'origin_revenue')
+
+
+def record_transaction_items(transaction_items):
+    """Прибавляет проданные позиции к ItemDailyStats одним запросом в транзакции продажи."""
+    totals = {}
+    for transaction_item in transaction_items:
+        transaction_obj = transaction_item.transaction
+        key = (transaction_obj.company_id, timezone.localdate(transaction_obj.created_at), transaction_item.item_id)
+        row = totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        row['quantity'] += transaction_item.quantity
+        row['revenue'] += Decimal(transaction_item.sell_price) * transaction_item.quantity
+        row['origin_revenue'] += Decimal(transaction_item.origin_price) * transaction_item.quantity
+    totals = sorted(totals.items(), key=lambda item: tuple(map(str, item[0])))
+    increment_rollup(ItemDailyStats, ('company_id', 'day', 'item_id'), COUNTERS, totals)
+
+
+def average_discount(revenue, origin_revenue):
+    """Доля скидки от цены прайса: 0.15 — продано в среднем на 15% дешевле."""
+    if not origin_revenue:
+        return Decimal(0)
+    return round(1 - Decimal(revenue) / Decimal(origin_revenue), 4)
+
+
+def item_totals(company_id, from_date, to_date):
+    """Количество и выручка каждого товара за период, по дневной свертке."""
+    return list(ItemDailyStats.objects.filter(
+        company_id=company_id,
+        day__range=[from_date, to_date],
+    ).values('item_id', name=F('item__name')).annotate(
+        quantity=Sum('quantity'),
+        revenue=Sum('revenue'),
+        origin_revenue=Sum('origin_revenue'),
+    ))
+
+
+def item_analytics(items, limit):
+    """Топ товаров из item_totals по выручке и количеству и средняя скидка за период."""
+    items = [dict(item, average_discount=average_discount(item['revenue'], item['origin_revenue']))
+             for item in items]
+
+    revenue = sum(item['revenue'] for item in items)
+    origin_revenue = sum(item['origin_revenue'] for item in items)
+    return {
+        'top_by_revenue': sorted(items, key=lambda item: (-item['revenue'], item['name']))[:limit],
+        'top_by_quantity': sorted(items, key=lambda item: (-item['quantity'], item['name']))[:limit],
+        'average_discount': average_discount(revenue, origin_revenue),
+    }
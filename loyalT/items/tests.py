@@ -1,3 +1,51 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from companies.models import Company
+from .models import Item
+
+User = get_user_model()
+
+
+class ItemListConditionalGetTests(APITestCase):
+    def test_not_modified_until_items_change(self):
+        company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        url = f'/api/company/{company.id}/item/'
+        etag = self.client.get(url).headers["ETag"]
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"name": "Капучино", "price": 100}, format="json")
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 1)
+
+
+class ItemSearchTests(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(user=User.objects.create(), name="Кофейня", username="coffee")
+        other = Company.objects.create(user=User.objects.create(), name="Пекарня", username="bakery")
+        for company, name, description in (
+                (self.company, "Латте", "кофе с молоком"),
+                (self.company, "Кофе по-турецки", "в джезве"),
+                (self.company, "Чизкейк", "десерт"),
+                (other, "Кофе с собой", "зерна арабики"),
+        ):
+            Item.objects.create(company=company, name=name, price=100, description=description)
+        self.url = f"/api/company/{self.company.id}/item/search/"
+
+    def test_search_ranks_name_matches_first_within_company(self):
+        response = self.client.get(self.url, {"q": "кофе"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Кофе по-турецки", "Латте"])
+
+    def test_search_does_not_return_other_company_items(self):
+        response = self.client.get(self.url, {"q": "арабики"})
+        self.assertEqual(response.data["results"], [])
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.url, {"q": "  "})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,10 +1,16 @@
 from rest_framework import serializers, viewsets
 from rest_framework import status, mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from items.models import Item, StatusEnum
+from items.prices import invalidate_price_table, items_version_keys
 from items.serializers import ItemSerializer
+from companies.serializers import SwaggerSearchQuery
+from utils.search import ranked_search, search_query_param
+from utils.versions import conditional
 
 
 class ItemView(
@@ -53,10 +59,43 @@ class ItemView(
             )
         }
     )
+    @conditional(items_version_keys)
     def list(self, request, *args, **kwargs):
         self.permission_classes = ()
         return super(ItemView, self).list(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        tags=["Item"],
+        method='get',
+        operation_id="search_items",
+        operation_summary="Поиск товаров компании",
+        operation_description="""
+        Полнотекстовый поиск по названию и описанию товаров компании с учетом опечаток в названии.
+        Результаты упорядочены по релевантности и разбиты на страницы (limit/offset).
+        Если параметр q пустой, возвращается ошибка 400.
+        """,
+        query_serializer=SwaggerSearchQuery,
+        responses={
+            200: openapi.Response(
+                description="Найденные товары",
+                schema=ItemSerializer(many=True)
+            ),
+            400: openapi.Response(
+                description="Пустой поисковый запрос",
+                examples={
+                    "application/json": {"detail": "Параметр q обязателен"}
+                }
+            )
+        }
+    )
+    @action(methods=["get"], detail=False, url_path="search", permission_classes=())
+    def search(self, request, *args, **kwargs):
+        query = search_query_param(request)
+        if query is None:
+            return Response({"detail": "Параметр q обязателен"}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(ranked_search(self.get_queryset().defer('search_vector'), query))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
     @swagger_auto_schema(
         tags=["Item"],
         operation_id="retrieve_item",
@@ -114,6 +153,7 @@ class ItemView(
         if not company_id:
             raise serializers.ValidationError('Company ID is required')
         serializer.save(company_id=company_id)
+        invalidate_price_table(company_id)
 
     @swagger_auto_schema(
         tags=["Item"],
@@ -148,6 +188,10 @@ class ItemView(
     def partial_update(self, request, *args, **kwargs):
         return super(ItemView, self).update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        item = serializer.save()
+        invalidate_price_table(item.company_id)
+
     @swagger_auto_schema(
         tags=["Item"],
         operation_id="list_items",
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'rest_framework',
     'rest_framework_simplejwt',
@@ -81,6 +82,16 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'loyalT.wsgi.application'
 
+# Кэш общий для всех воркеров gunicorn: у LocMem он свой в каждом процессе, и сброс
+# таблицы цен или настроек компании в одном воркере не доходил бы до остальных.
+# Redis, а не DatabaseCache: чтение кэша не должно стоить запроса в базу.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', '6379')}/0",
+    }
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -167,7 +178,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.auth.authentication.PrincipalJWTAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
@@ -197,9 +208,9 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
     "USER_AUTHENTICATION_RULE": "rest_framework_simplejwt.authentication.default_user_authentication_rule",
 
-    "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.SlidingToken",),
+    "AUTH_TOKEN_CLASSES": ("users.auth.tokens.LoyalTSlidingToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
-    "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
+    "TOKEN_USER_CLASS": "users.auth.authentication.Principal",
 
     "JTI_CLAIM": "jti",
 
@@ -215,3 +226,19 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
+
+# Ответы POST /api/cashier/sell/ по заголовку Idempotency-Key
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24).total_seconds()
+IDEMPOTENCY_MAX_ENTRIES = 50_000
+
+# Срок жизни токена расчета из POST /api/cashier/pre-sale/, секунды
+QUOTE_TOKEN_MAX_AGE = timedelta(minutes=10).total_seconds()
+
+# Кэш отозванных JTI в памяти воркера: как часто подгружать отзывы из других воркеров, секунды
+REVOKED_TOKENS_REFRESH_INTERVAL = 5
+REVOKED_TOKENS_REFRESH_OVERLAP = 60
+# Сколько JTI воркер держит в памяти; при большем числе отзывов недостающие проверяются в базе
+REVOKED_TOKENS_MAX_SIZE = 100000
+
+# Сколько секунд воркер доверяет закэшированной версии токенов пользователя
+TOKEN_VERSION_CACHE_TIMEOUT = 30
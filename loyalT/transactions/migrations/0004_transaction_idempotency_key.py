@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashiers', '0003_initial'),
+        ('clients', '0002_remove_client_image_url'),
+        ('companies', '0004_company_description'),
+        ('transactions', '0003_alter_transaction_client'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('cashier', 'idempotency_key'), name='transaction_cashier_idempotency_key'),
+        ),
+    ]
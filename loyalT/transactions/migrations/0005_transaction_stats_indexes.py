@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:37
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует вставку продаж, но не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('cashiers', '0003_initial'),
+        ('clients', '0002_remove_client_image_url'),
+        ('companies', '0005_company_daily_stats'),
+        ('transactions', '0004_transaction_idempotency_key'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['company', 'created_at'], include=('price', 'points_earned', 'client'), name='transaction_company_created'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['company', 'cashier', 'created_at'], include=('price', 'points_earned'), name='transaction_company_cashier'),
+        ),
+    ]
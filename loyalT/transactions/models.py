@@ -17,3 +17,21 @@ class Transaction(models.Model):
     points_used = models.BigIntegerField()
     points_earned = models.BigIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cashier", "idempotency_key"],
+                condition=models.Q(idempotency_key__isnull=False),
+                name="transaction_cashier_idempotency_key",
+            ),
+        ]
+        indexes = [
+            # Статистика компании за период: index-only scan по диапазону created_at
+            models.Index(fields=["company", "created_at"], include=["price", "points_earned", "client"],
+                         name="transaction_company_created"),
+            # Статистика по кассирам: группировка по cashier внутри компании
+            models.Index(fields=["company", "cashier", "created_at"], include=["price", "points_earned"],
+                         name="transaction_company_cashier"),
+        ]
@@ -0,0 +1,72 @@
+import uuid
+
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import principal_claims
+from .versions import get_token_version
+
+LEGACY_CLAIMS_CACHE_KEY = 'users:principal_claims:{user_id}'
+LEGACY_CLAIMS_CACHE_TIMEOUT = 60 * 60
+
+
+def _as_uuid(value):
+    return uuid.UUID(str(value)) if value else None
+
+
+class Principal(TokenUser):
+    """Пользователь запроса, собранный из claims токена.
+
+    Повторяет интерфейс users.User (id, role, company_id, cashier_id), поэтому права и
+    представления работают одинаково с обоими, но Principal не обращается к базе.
+    """
+
+    @cached_property
+    def id(self):
+        return _as_uuid(super().id)
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def company_id(self):
+        return _as_uuid(self.token.get('company_id'))
+
+    @cached_property
+    def cashier_id(self):
+        return _as_uuid(self.token.get('cashier_id'))
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        # Токены, выданные до появления версии, считаются выданными с версией 0
+        token_version = validated_token.get('token_version', 0)
+
+        if 'role' in validated_token:
+            principal = Principal(validated_token)
+        else:
+            principal = Principal(validated_token.payload | self.legacy_claims(validated_token))
+
+        if token_version != get_token_version(principal.id):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return principal
+
+    def legacy_claims(self, validated_token):
+        """Claims для токенов, выданных до их появления: из базы один раз, дальше из кэша.
+
+        Роль и компания пользователя не меняются, а отзыв проверяется по token_version,
+        поэтому claims кэшируются по id пользователя без версии.
+        """
+        key = LEGACY_CLAIMS_CACHE_KEY.format(user_id=validated_token[api_settings.USER_ID_CLAIM])
+        claims = cache.get(key)
+        if claims is None:
+            claims = principal_claims(super().get_user(validated_token))
+            del claims['token_version']
+            cache.set(key, claims, LEGACY_CLAIMS_CACHE_TIMEOUT)
+        return claims
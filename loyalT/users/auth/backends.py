@@ -14,7 +14,7 @@ class LoyalTBackendAuth(BaseBackend):
 
         if user_type == User.UserTypeChoices.Cashier:
             try:
-                cashier = User.objects.get(cashier__username=username)
+                cashier = User.objects.get(cashier__username=username, cashier__status="ACTIVE")
                 if cashier.check_password(password):
                     return cashier
             except ObjectDoesNotExist:
@@ -0,0 +1,82 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+
+class RevokedTokens:
+    """Отозванные JTI, которые еще не истекли, в памяти воркера.
+
+    Проверка токена — поиск в словаре без запроса к базе. Отзывы из этого воркера попадают
+    сюда сразу через сигналы, а из остальных — при подгрузке новых строк BlacklistedToken
+    не чаще раза в refresh_interval секунд. Подгрузка перекрывает предыдущую на overlap,
+    чтобы не пропустить строки из транзакций, закоммиченных позже соседних.
+
+    В памяти хранится не больше max_size JTI. Если отзывов больше, набор помечается
+    переполненным, и JTI, которого в нем нет, проверяется запросом к базе, пока после
+    истечения части отзывов полная подгрузка снова не уложится в max_size.
+    """
+
+    def __init__(self, refresh_interval, overlap, max_size):
+        self.refresh_interval = refresh_interval
+        self.overlap = overlap
+        self.max_size = max_size
+        self._expires_at = {}
+        self._overflowed = False
+        self._loaded_until = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti):
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+        if jti in self._expires_at:
+            return True
+        return self._overflowed and BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            if jti in self._expires_at or len(self._expires_at) < self.max_size:
+                self._expires_at[jti] = expires_at
+            else:
+                self._overflowed = True
+
+    def discard(self, jti):
+        with self._lock:
+            self._expires_at.pop(jti, None)
+
+    def refresh(self):
+        with self._lock:
+            now = timezone.now()
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+            if self._overflowed:
+                # В переполненный набор попали не все отзывы: подгружаем их заново целиком
+                expires_at = {}
+            else:
+                expires_at = {jti: exp for jti, exp in self._expires_at.items() if exp > now}
+                if self._loaded_until is not None:
+                    rows = rows.filter(blacklisted_at__gte=self._loaded_until - self.overlap)
+
+            overflowed = False
+            for jti, exp in rows.values_list('token__jti', 'token__expires_at').iterator():
+                if jti not in expires_at and len(expires_at) >= self.max_size:
+                    overflowed = True
+                    break
+                expires_at[jti] = exp
+            self._expires_at = expires_at
+            self._overflowed = overflowed
+            self._loaded_until = now
+            self._refreshed_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._expires_at)
+
+
+revoked_tokens = RevokedTokens(
+    refresh_interval=settings.REVOKED_TOKENS_REFRESH_INTERVAL,
+    overlap=timedelta(seconds=settings.REVOKED_TOKENS_REFRESH_OVERLAP),
+    max_size=settings.REVOKED_TOKENS_MAX_SIZE,
+)
@@ -0,0 +1,36 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from .blacklist import revoked_tokens
+
+
+def principal_claims(user):
+    """Роль, идентификаторы и версия токенов пользователя, которые кладутся в токен при выдаче."""
+    return {
+        'token_version': user.token_version,
+        'role': user.role,
+        'company_id': str(user.company_id) if user.company_id else None,
+        'cashier_id': str(user.cashier_id) if user.cashier_id else None,
+    }
+
+
+class LoyalTSlidingToken(SlidingToken):
+    """Sliding-токен с claims role, company_id, cashier_id и token_version.
+
+    По ним PrincipalJWTAuthentication собирает пользователя запроса без запросов к базе.
+    Токен действителен, пока token_version совпадает с текущей версией пользователя.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in principal_claims(user).items():
+            token[claim] = value
+        return token
+
+    def check_blacklist(self):
+        # Вместо запроса к BlacklistedToken на каждый запрос — поиск в кэше воркера
+        if self.payload[api_settings.JTI_CLAIM] in revoked_tokens:
+            raise TokenError(_("Token is blacklisted"))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+TOKEN_VERSION_CACHE_KEY = 'users:token_version:{user_id}'
+
+User = get_user_model()
+
+
+def get_token_version(user_id):
+    """Текущая версия токенов пользователя; None, если пользователя нет."""
+    key = TOKEN_VERSION_CACHE_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(id=user_id).values_list('token_version', flat=True).first()
+        if version is not None:
+            cache.set(key, version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def revoke_user_tokens(user_id):
+    """Отзывает все выданные пользователю токены одним UPDATE, независимо от числа устройств."""
+    key = TOKEN_VERSION_CACHE_KEY.format(user_id=user_id)
+    User.objects.filter(id=user_id).update(token_version=F('token_version') + 1)
+    cache.delete(key)
+    # Чтение между UPDATE и коммитом могло снова положить в кэш старую версию
+    transaction.on_commit(lambda: cache.delete(key))
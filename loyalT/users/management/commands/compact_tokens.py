@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = "Удаляет истекшие OutstandingToken и BlacklistedToken небольшими пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help="Пауза между пачками, секунды")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Остановиться после указанного числа пачек")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Токены выдаются с одинаковым сроком жизни, поэтому истекшие лежат в начале по id
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+
+        outstanding_deleted = blacklisted_deleted = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+
+            # Каждая пачка — отдельная короткая транзакция, блокировки не копятся
+            with transaction.atomic():
+                blacklisted, _ = BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                outstanding, _ = OutstandingToken.objects.filter(id__in=ids).delete()
+            blacklisted_deleted += blacklisted
+            outstanding_deleted += outstanding
+            batches += 1
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(f"outstanding deleted: {outstanding_deleted}, blacklisted deleted: {blacklisted_deleted}, "
+                          f"batches: {batches}")
@@ -11,12 +11,32 @@ class User(AbstractBaseUser, PermissionsMixin):
         Cashier = 'Cashier'
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    token_version = models.PositiveIntegerField(default=0)
 
     objects = UserManager()
 
     USERNAME_FIELD = "id"
     REQUIRED_FIELDS = ()
 
+    @property
+    def role(self):
+        if hasattr(self, "company"):
+            return User.UserTypeChoices.Company.value
+        if hasattr(self, "cashier"):
+            return User.UserTypeChoices.Cashier.value
+
+    @property
+    def company_id(self):
+        if hasattr(self, "company"):
+            return self.company.id
+        if hasattr(self, "cashier"):
+            return self.cashier.company_id
+
+    @property
+    def cashier_id(self):
+        if hasattr(self, "cashier"):
+            return self.cashier.id
+
     @property
     def username(self):
         if hasattr(self, "company"):
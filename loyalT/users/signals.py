@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from users.auth.blacklist import revoked_tokens
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_revoked_token(sender, instance, created, **kwargs):
+    if created:
+        revoked_tokens.add(instance.token.jti, instance.token.expires_at)
+
+
+@receiver(post_delete, sender=BlacklistedToken)
+def forget_revoked_token(sender, instance, **kwargs):
+    # Токен не подгружается: при удалении пачкой это был бы отдельный запрос на каждую строку.
+    # Не загруженный JTI остается в памяти отозванным до своего истечения
+    if BlacklistedToken.token.is_cached(instance):
+        revoked_tokens.discard(instance.token.jti)
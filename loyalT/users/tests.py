@@ -0,0 +1,69 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .auth.blacklist import RevokedTokens
+from .models import User
+
+
+class CompactTokensTests(APITestCase):
+    def test_deletes_only_expired_tokens(self):
+        user = User.objects.create()
+        now = timezone.now()
+        expired = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=f"expired-{i}", token="t", expires_at=now - timedelta(minutes=1))
+            for i in range(5)
+        ])
+        alive = OutstandingToken.objects.create(user=user, jti="alive", token="t", expires_at=now + timedelta(days=1))
+        BlacklistedToken.objects.create(token=expired[0])
+        BlacklistedToken.objects.create(token=alive)
+
+        out = StringIO()
+        call_command('compact_tokens', batch_size=2, stdout=out)
+
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ["alive"])
+        self.assertEqual(BlacklistedToken.objects.get().token_id, alive.id)
+        self.assertIn("outstanding deleted: 5, blacklisted deleted: 1, batches: 3", out.getvalue())
+
+    def test_batch_does_not_load_tokens_per_row(self):
+        user = User.objects.create()
+        expired_at = timezone.now() - timedelta(minutes=1)
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=f"expired-{i}", token="t", expires_at=expired_at) for i in range(200)
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
+
+        # Выборки и DELETE по 100 строк (так режет Django) плюс точка сохранения, без запроса на каждый токен
+        with CaptureQueriesContext(connection) as queries:
+            call_command('compact_tokens', batch_size=200, max_batches=1, stdout=StringIO())
+        self.assertLessEqual(len(queries), 10)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+class RevokedTokensTests(APITestCase):
+    def test_overflow_falls_back_to_database(self):
+        user = User.objects.create()
+        expires_at = timezone.now() + timedelta(days=1)
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=f"revoked-{i}", token="t", expires_at=expires_at) for i in range(3)
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
+        revoked = RevokedTokens(refresh_interval=60, overlap=timedelta(seconds=60), max_size=2)
+
+        self.assertTrue(all(f"revoked-{i}" in revoked for i in range(3)))
+        self.assertEqual(len(revoked), 2)
+        with self.assertNumQueries(1):
+            self.assertNotIn("alive", revoked)
+
+        # Когда отзывов снова не больше max_size, проверка опять обходится без базы
+        BlacklistedToken.objects.filter(token=tokens[0]).delete()
+        revoked.refresh()
+        with self.assertNumQueries(0):
+            self.assertNotIn("alive", revoked)
+            self.assertIn("revoked-1", revoked)
@@ -0,0 +1,18 @@
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Непрозрачный курсор keyset-пагинации из значений ключа сортировки последней строки."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Обратное к encode_cursor; на испорченный курсор бросает ValueError."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
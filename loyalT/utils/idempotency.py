@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyStore:
+    """Ограниченное хранилище первых ответов по ключам идемпотентности.
+
+    Все записи живут одинаковый TTL и не переупорядочиваются при чтении, поэтому
+    порядок вставки совпадает с порядком истечения: вытеснение идёт с головы
+    OrderedDict, и get/set остаются O(1) (амортизированно).
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, value)
+            self._evict(now)
+
+    def _evict(self, now):
+        while self._entries:
+            expires_at, _ = next(iter(self._entries.values()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,14 +1,15 @@
-from rest_framework_simplejwt.tokens import SlidingToken
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 from django.utils import timezone
 
+from users.auth.tokens import LoyalTSlidingToken
+
 
 class InvalidateOldTokenSerializerMixin:
 
     def validate(self, attrs):
         data = super().validate(attrs)
 
-        refresh = SlidingToken.for_user(self.user)
+        refresh = LoyalTSlidingToken.for_user(self.user)
 
         decoded_token = refresh.payload
         new_jti = decoded_token['jti']
@@ -0,0 +1,28 @@
+from django.db import connection
+
+
+def increment_rollup(model, key_columns, counters, totals):
+    """Прибавляет счетчики к строкам свертки одним INSERT ... ON CONFLICT DO UPDATE.
+
+    totals — список (ключ, {счетчик: прирост}); по key_columns у модели должно быть уникальное
+    ограничение. Вызывающий код передает строки в одинаковом для всех воркеров порядке,
+    чтобы параллельные продажи не ловили deadlock.
+    """
+    if not totals:
+        return
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = tuple(key_columns) + tuple(counters)
+    values = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(totals))
+    updates = ", ".join(f"{column} = {table}.{column} + EXCLUDED.{column}" for column in counters)
+    params = [
+        value
+        for key, row in totals
+        for value in (*key, *(row[column] for column in counters))
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}",
+            params,
+        )
@@ -0,0 +1,33 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import F, Q
+
+# Русская конфигурация стеммит русские слова, а латиницу обрабатывает английским стеммером
+SEARCH_CONFIG = 'russian'
+
+
+SEARCH_QUERY_MAX_LENGTH = 255
+
+
+def search_query_param(request):
+    """Параметр q из запроса или None, если он пустой."""
+    query = request.query_params.get('q', '').strip()
+    return query[:SEARCH_QUERY_MAX_LENGTH] or None
+
+
+def search_vector(title_field, body_field):
+    """Выражение tsvector для GeneratedField: совпадения в названии весят больше, чем в описании."""
+    return (SearchVector(title_field, weight='A', config=SEARCH_CONFIG)
+            + SearchVector(body_field, weight='B', config=SEARCH_CONFIG))
+
+
+def ranked_search(queryset, query, title_field='name'):
+    """Полнотекстовый поиск по search_vector плюс нечеткий по триграммам названия.
+
+    Оба условия обслуживаются GIN-индексами; результаты упорядочены по сумме рангов.
+    """
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=search_query) | Q(**{f'{title_field}__trigram_word_similar': query}),
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query) + TrigramWordSimilarity(query, title_field),
+    ).order_by('-rank', 'id')
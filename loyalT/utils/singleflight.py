@@ -0,0 +1,31 @@
+import threading
+from contextlib import contextmanager
+
+
+class SingleFlight:
+    """Блокировки по ключу: параллельные промахи кэша по одному ключу ждут первого вычисления.
+
+    Блокировка ключа удаляется, когда ее больше никто не держит и не ждет, поэтому
+    словарь не растет с числом разных ключей.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lock(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
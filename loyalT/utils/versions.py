@@ -0,0 +1,63 @@
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def get_versions(keys):
+    """Штампы версий ресурсов одним чтением из кэша; отсутствующие заводятся заново.
+
+    Штампы хранятся без срока: меняет их только bump_versions.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начальное значение от времени: после вытеснения ключа версия не повторит уже использованную
+            version = time.time_ns()
+            versions[key] = version if cache.add(key, version, None) else cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def get_version(key):
+    return get_versions([key])[0]
+
+
+def bump_versions(keys):
+    """Сдвигает версии после коммита текущей транзакции."""
+    def bump():
+        version = time.time_ns()
+        cache.set_many({key: version for key in keys}, None)
+
+    transaction.on_commit(bump)
+
+
+def conditional(version_keys):
+    """Декоратор GET-метода view: ETag и Last-Modified из штампов версий.
+
+    version_keys(request, *args, **kwargs) возвращает ключи версий, от которых зависит ответ.
+    Если клиент прислал совпадающий If-None-Match или If-Modified-Since, сразу отдается
+    304 Not Modified — основной запрос и сериализация не выполняются. Штампы лежат в общем
+    кэше, поэтому сдвиг в одном воркере сразу виден остальным, а проверка не ходит в базу.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            versions = get_versions(version_keys(request, *args, **kwargs))
+            etag = 'W/"%s"' % '.'.join(map(str, versions))
+            # Секунды округляются вверх, чтобы изменение не оказалось раньше уже отданной даты
+            last_modified = -(-max(versions) // 10 ** 9)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers['ETag'] = etag
+                response.headers['Last-Modified'] = http_date(last_modified)
+            return response
+
+        return wrapper
+
+    return decorator